@@ -1,17 +1,33 @@
-from typing import TypedDict, Annotated, List
+from typing import TypedDict, Annotated, List, Literal
+import contextlib
+import functools
+import json
 import operator
 import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, AIMessageChunk, SystemMessage, ToolMessage
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.checkpoint.memory import MemorySaver
 
 # ---- Agent creation imports ----
 USE_NEW_API = False
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 try:
     from langchain.agents import create_agent
     USE_NEW_API = True
@@ -30,190 +46,626 @@ except ImportError:
 
 from logging_setup import SYSTEM_LOGGER
 from tools import get_patient_discharge_report, clinical_web_search
-from rag_setup import RAG_RETRIEVAL_CHAIN
+from prompts import RECEPTIONIST_SYSTEM_PROMPT, CLINICAL_SYSTEM_PROMPT
 from langchain_core.tools import tool
 
+# Set by app.py once the nephrology vector store has been built or loaded.
+RAG_RETRIEVAL_CHAIN = None
+
+MAX_HISTORY_MESSAGES = 32
+
+def append_trim(left: List[BaseMessage], right: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Messages reducer: appends the update and keeps only the newest
+    MAX_HISTORY_MESSAGES, so state stays bounded on long sessions. Older turns
+    survive through conversation_summary. Messages are given ids so the
+    summary anchor still resolves after the front of the list is trimmed.
+    """
+    if not isinstance(right, list):
+        right = [right]
+    for message in right:
+        if message.id is None:
+            message.id = str(uuid.uuid4())
+    merged = list(left) + right
+    return merged[-MAX_HISTORY_MESSAGES:]
+
 class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], append_trim]
     current_agent: str
     patient_report: str
-
-LLM = ChatOpenAI(
-    model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-    temperature=0,
-    api_key=os.getenv("OPENAI_API_KEY")
+    conversation_summary: str
+    summary_anchor_id: str
+    hops: int
+    handoff: str
+
+# Agent handoffs allowed within one user turn before the graph stops, so a
+# receptionist <-> clinical ping-pong cannot burn the whole recursion limit.
+MAX_HOPS = 2
+# One step per agent node visit plus the handoff_limit_node reply.
+RECURSION_LIMIT = MAX_HOPS + 3
+HANDOFF_LIMIT_REPLY = (
+    "I'm sorry, I couldn't work out which of our assistants should answer that. "
+    "Could you rephrase your question, or ask about your discharge details and "
+    "your medical question separately?"
 )
 
+# Clients, agents and the compiled graph are built on first use so importing
+# this module (e.g. for its prompts or tools) stays cheap.
+@functools.cache
+def get_llm():
+    return ChatOpenAI(
+        model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+        temperature=0,
+        streaming=True,
+        api_key=os.getenv("OPENAI_API_KEY")
+    )
+
+@functools.cache
+def get_small_llm():
+    return ChatOpenAI(
+        model=os.getenv("OPENAI_SMALL_MODEL", "gpt-4o-mini"),
+        temperature=0,
+        streaming=True,
+        api_key=os.getenv("OPENAI_API_KEY")
+    )
+
+# Identical questions asked concurrently (several sessions, or a speculative
+# prefetch racing the agent's own tool call) share one retrieval.
+_INFLIGHT_RAG = {}
+_INFLIGHT_RAG_LOCK = threading.Lock()
+
+def _coalesced(key: str, fn):
+    with _INFLIGHT_RAG_LOCK:
+        future = _INFLIGHT_RAG.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _INFLIGHT_RAG[key] = future
+    if not owner:
+        SYSTEM_LOGGER.info("RAG: Joining in-flight retrieval for '%s'", key)
+        return future.result()
+    try:
+        future.set_result(fn())
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _INFLIGHT_RAG_LOCK:
+            _INFLIGHT_RAG.pop(key, None)
+    return future.result()
+
 @tool
 def rag_query_tool(query: str) -> str:
+    """Answer a clinical question from the nephrology reference book."""
     if RAG_RETRIEVAL_CHAIN is None:
         return "ERROR: RAG system not initialized."
     try:
-        result = RAG_RETRIEVAL_CHAIN.invoke({"input": query})
+        semantic_cache = getattr(RAG_RETRIEVAL_CHAIN, "semantic_cache", None)
+        if semantic_cache is not None:
+            query_vector, cached_output = semantic_cache.lookup(query)
+            if cached_output is not None:
+                SYSTEM_LOGGER.info("RAG CACHE HIT: '%s'", query)
+                return cached_output
+
+        key = " ".join(query.lower().split())
+        inputs = {"input": query}
+        if semantic_cache is not None:
+            inputs["query_vector"] = query_vector
+        result = _coalesced(key, lambda: RAG_RETRIEVAL_CHAIN.invoke(inputs))
         rag_output = result.get("output", "No relevant information found.")
+        if semantic_cache is not None and result.get("source_documents"):
+            semantic_cache.insert(query, query_vector, rag_output)
         return rag_output
     except Exception as e:
         return f"ERROR: Unable to query reference materials. Error: {e}"
 
-RECEPTIONIST_TOOLS = [get_patient_discharge_report]
-CLINICAL_TOOLS = [rag_query_tool, clinical_web_search]
-
-MEDICAL_DISCLAIMER = (
-    "NOTE: This is an AI assistant for educational purposes only. "
-    "Always consult healthcare professionals for medical advice."
-)
-
-RECEPTIONIST_SYSTEM_PROMPT = (
-    f"You are the Post-Discharge Receptionist AI. {MEDICAL_DISCLAIMER}\n"
-    "1. Greet the patient and ask for their full name.\n"
-    "2. Retrieve the report using the tool once.\n"
-    "3. After retrieving, ask follow-up questions.\n"
-    "4. For medical questions, return 'HANDOFF_TO_CLINICAL'.\n"
-    "5. Be empathetic and helpful."
+MEDICAL_KEYWORDS = (
+    "swelling", "pain", "shortness of breath", "symptom", "medication",
+    "side effect", "diet", "dizziness", "fever", "blood", "urine", "rash"
 )
+MEDICAL_KEYWORDS_RE = re.compile("|".join(map(re.escape, MEDICAL_KEYWORDS)), re.IGNORECASE)
+MIN_KEYWORD_LENGTH = min(map(len, MEDICAL_KEYWORDS))
+
+SEMANTIC_KEYWORD_THRESHOLD = 0.6
+_keyword_matrix_cache = (None, None)
+
+def _keyword_matrix(embeddings):
+    """(K, D) float32 matrix of unit-norm keyword embeddings, rebuilt only when the embedding model changes."""
+    global _keyword_matrix_cache
+    cached_embeddings, matrix = _keyword_matrix_cache
+    if cached_embeddings is not embeddings:
+        matrix = np.asarray(embeddings.embed_documents(list(MEDICAL_KEYWORDS)), dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        _keyword_matrix_cache = (embeddings, matrix)
+    return matrix
+
+def is_medical_query(text: str) -> bool:
+    if len(text) < MIN_KEYWORD_LENGTH:
+        return False
+    if MEDICAL_KEYWORDS_RE.search(text) is not None:
+        return True
+    # Paraphrases ("my legs are puffy") miss the substrings; compare against
+    # the keyword embeddings with the RAG store's local model once it is loaded.
+    semantic_cache = getattr(RAG_RETRIEVAL_CHAIN, "semantic_cache", None)
+    if semantic_cache is None or SMALL_TALK_ONLY_RE.fullmatch(text):
+        return False
+    try:
+        matrix = _keyword_matrix(semantic_cache.embeddings)
+        # semantic_cache.embed memoises the unit vector for the RAG lookup later in the turn.
+        return float((matrix @ semantic_cache.embed(text)).max()) >= SEMANTIC_KEYWORD_THRESHOLD
+    except Exception as e:
+        SYSTEM_LOGGER.warning("ROUTING: Semantic keyword match failed. Error: %s", e)
+        return False
 
-CLINICAL_SYSTEM_PROMPT = (
-    f"You are the Clinical AI Agent specializing in Nephrology. {MEDICAL_DISCLAIMER}\n"
-    "1. ALWAYS use rag_query_tool first.\n"
-    "2. If insufficient data, use clinical_web_search.\n"
-    "3. RAG results → cite [Source: Internal Nephrology Reference].\n"
-    "4. Web search → cite [Source: General Internet Search].\n"
-    "5. If non-medical: return 'HANDOFF_TO_RECEPTIONIST'."
-)
+SMALL_TALK_WORDS = r"hi|hello|hey|thanks|thank you|ok|okay|yes|no|bye|good (?:morning|afternoon|evening)"
+SMALL_TALK_RE = re.compile(rf"^\s*({SMALL_TALK_WORDS})\b", re.IGNORECASE)
+# Whole-message small talk only: "Hi, my legs are puffy" still gets the semantic check.
+SMALL_TALK_ONLY_RE = re.compile(rf"\s*(?:(?:{SMALL_TALK_WORDS})(?:\s+there)?[\s,.!?]*)+", re.IGNORECASE)
+SMALL_MODEL_MAX_CHARS = 40
 
-if USE_NEW_API:
-    receptionist_agent_graph = create_agent(LLM, RECEPTIONIST_TOOLS, system_prompt=RECEPTIONIST_SYSTEM_PROMPT)
-    clinical_agent_graph = create_agent(LLM, CLINICAL_TOOLS, system_prompt=CLINICAL_SYSTEM_PROMPT)
-
-    class AgentWrapper:
-        def __init__(self, agent_graph):
-            self.agent_graph = agent_graph
-        
-        def invoke(self, state):
-            try:
-                messages = state.get("messages", [])
-                result = self.agent_graph.invoke({"messages": messages})
-                result_messages = result.get("messages", [])
-                if result_messages:
-                    content = getattr(result_messages[-1], "content", str(result_messages[-1]))
-                else:
-                    content = ""
-                return {"output": content, "messages": result_messages}
-            except Exception as e:
-                return {"output": f"Error: {str(e)}", "messages": state.get("messages", [])}
-
-    receptionist_agent = AgentWrapper(receptionist_agent_graph)
-    clinical_agent = AgentWrapper(clinical_agent_graph)
-
-else:
-    RECEPTIONIST_PROMPT = ChatPromptTemplate.from_messages([
-        ("system", RECEPTIONIST_SYSTEM_PROMPT),
-        ("placeholder", "{messages}")
-    ])
+def is_trivial_query(text: str) -> bool:
+    return len(text) < SMALL_MODEL_MAX_CHARS or SMALL_TALK_RE.match(text) is not None
 
-    CLINICAL_PROMPT = ChatPromptTemplate.from_messages([
-        ("system", CLINICAL_SYSTEM_PROMPT),
+SPECULATIVE_SEARCH_RE = re.compile(
+    r"\b(latest|newest|recent|new research|guidelines?|trials?|20\d\d)\b",
+    re.IGNORECASE
+)
+CONTEXT_PREAMBLE = (
+    "Reference material already retrieved for this question. Use it instead of calling "
+    "the tools again and cite the sources shown.\n\n"
+)
+CONTEXT_CHAR_BUDGET = 1500
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_TERM_RE = re.compile(r"[a-z0-9]{4,}")
+
+def compress_context(context: str, query: str, budget: int = CONTEXT_CHAR_BUDGET) -> str:
+    """
+    Extractive compression without an LLM call: keeps source headers and
+    citation lines, then the sentences sharing the most terms with the query,
+    up to `budget` characters, in their original order.
+    """
+    if len(context) <= budget:
+        return context
+    terms = set(_TERM_RE.findall(query.lower()))
+    sentences = [s.strip() for s in _SENTENCE_SPLIT_RE.split(context) if s.strip()]
+    keep = {i for i, s in enumerate(sentences) if "[Source" in s or s.endswith(":")}
+    used = sum(len(sentences[i]) + 1 for i in keep)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(terms.intersection(_TERM_RE.findall(sentences[i].lower()))), i)
+    )
+    for i in ranked:
+        if i not in keep and used + len(sentences[i]) + 1 <= budget:
+            keep.add(i)
+            used += len(sentences[i]) + 1
+    return "\n".join(sentences[i] for i in sorted(keep))
+
+def last_user_query(messages: List[BaseMessage]) -> str:
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return msg.content
+    return ""
+
+PATIENT_REPORT_RE = re.compile(r'\A\s*\{\s*"patient_name"\s*:')
+
+def pretty_json(text: str) -> str:
+    if orjson is not None:
+        return orjson.dumps(orjson.loads(text), option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(json.loads(text), indent=2)
+
+@tool(return_direct=True)
+def handoff(target: Literal["clinical", "receptionist"]) -> str:
+    """Transfer the conversation to the clinical or receptionist agent."""
+    return f"HANDOFF_TO_{target.upper()}"
+
+HANDOFF_OUTPUTS = {"HANDOFF_TO_CLINICAL": "clinical", "HANDOFF_TO_RECEPTIONIST": "receptionist"}
+HANDOFF_NODES = {"clinical": "clinical_agent_node", "receptionist": "receptionist_agent_node"}
+
+def handoff_target(result) -> str:
+    """Target of a handoff tool call in the agent's final step, or "" when it answered directly."""
+    for msg in reversed(result.get("messages", [])):
+        if isinstance(msg, AIMessage):
+            for call in msg.tool_calls:
+                if call["name"] == "handoff":
+                    return call["args"].get("target", "")
+            break
+    # AgentExecutor returns the return_direct tool output without the tool calls.
+    return HANDOFF_OUTPUTS.get(result.get("output", "").strip(), "")
+
+RECEPTIONIST_TOOLS = [get_patient_discharge_report, handoff]
+CLINICAL_TOOLS = [rag_query_tool, clinical_web_search, handoff]
+
+# The system prompts are sent verbatim as the first message of every request.
+# Keeping them byte-identical (no per-turn formatting, no runtime data) lets the
+# provider's automatic prompt-prefix cache reuse the prefill across turns.
+RECEPTIONIST_SYSTEM_MESSAGE = SystemMessage(content=RECEPTIONIST_SYSTEM_PROMPT.strip())
+CLINICAL_SYSTEM_MESSAGE = SystemMessage(content=CLINICAL_SYSTEM_PROMPT.strip())
+
+class AgentWrapper:
+    def __init__(self, agent_graph):
+        self.agent_graph = agent_graph
+
+    def invoke(self, state):
+        try:
+            messages = state.get("messages", [])
+            result = self.agent_graph.invoke({"messages": messages})
+            result_messages = result.get("messages", [])
+            if result_messages:
+                content = getattr(result_messages[-1], "content", str(result_messages[-1]))
+            else:
+                content = ""
+            return {"output": content, "messages": result_messages}
+        except Exception as e:
+            return {"output": f"Error: {str(e)}", "messages": state.get("messages", [])}
+
+def _build_agent(llm, tools, system_message):
+    if USE_NEW_API:
+        return AgentWrapper(create_agent(llm, tools, system_prompt=system_message))
+    prompt = ChatPromptTemplate.from_messages([
+        system_message,
         ("placeholder", "{messages}")
     ])
+    return AgentExecutor(agent=create_react_agent(llm, tools, prompt), tools=tools, verbose=False)
+
+@functools.cache
+def get_receptionist_agent(small: bool = False):
+    llm = get_small_llm() if small else get_llm()
+    return _build_agent(llm, RECEPTIONIST_TOOLS, RECEPTIONIST_SYSTEM_MESSAGE)
+
+@functools.cache
+def get_clinical_agent():
+    return _build_agent(get_llm(), CLINICAL_TOOLS, CLINICAL_SYSTEM_MESSAGE)
+
+HISTORY_TOKEN_LIMIT = 512
+HISTORY_WINDOW = 6
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=(
+        "Condense the conversation between a post-discharge patient and the care assistant. "
+        "Keep the patient's name, diagnosis, medications, symptoms raised and advice given. "
+        "Reply with the updated summary only."
+    )),
+    ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{lines}")
+])
+
+def _count_tokens(messages: List[BaseMessage]) -> int:
+    try:
+        return get_llm().get_num_tokens_from_messages(messages)
+    except Exception:
+        return sum(len(str(m.content)) for m in messages) // 4
+
+def _summarize(summary: str, messages: List[BaseMessage]) -> str:
+    lines = "\n".join(f"{m.type}: {m.content}" for m in messages)
+    chain = (SUMMARY_PROMPT | get_llm()).with_config(tags=[TAG_NOSTREAM])
+    response = chain.invoke({"summary": summary or "(none)", "lines": lines})
+    return getattr(response, "content", str(response))
+
+def bounded_history(state: AgentState):
+    """
+    Returns (messages, state_update) for an agent call. Once the unsummarised
+    history exceeds HISTORY_TOKEN_LIMIT, everything but the last HISTORY_WINDOW
+    messages is folded into a rolling summary, which is sent as a single system
+    message ahead of the recent window.
+    """
+    messages = state.get("messages", [])
+    summary = state.get("conversation_summary", "")
+    # summary_anchor_id is the first message not yet folded into the summary.
+    # If append_trim has already dropped it, every remaining message is newer.
+    anchor_id = state.get("summary_anchor_id")
+    start = next((i for i, m in enumerate(messages) if m.id == anchor_id), 0) if anchor_id else 0
+    recent = messages[start:]
+    update = {}
+
+    if len(recent) > HISTORY_WINDOW and _count_tokens(recent) > HISTORY_TOKEN_LIMIT:
+        folded = recent[:-HISTORY_WINDOW]
+        try:
+            summary = _summarize(summary, folded)
+            recent = recent[-HISTORY_WINDOW:]
+            update = {"conversation_summary": summary, "summary_anchor_id": recent[0].id}
+        except Exception as e:
+            SYSTEM_LOGGER.warning("HISTORY: Summarisation failed, sending full history. Error: %s", e)
 
-    receptionist_agent_runnable = create_react_agent(LLM, RECEPTIONIST_TOOLS, RECEPTIONIST_PROMPT)
-    clinical_agent_runnable = create_react_agent(LLM, CLINICAL_TOOLS, CLINICAL_PROMPT)
-
-    receptionist_agent = AgentExecutor(agent=receptionist_agent_runnable, tools=RECEPTIONIST_TOOLS, verbose=False)
-    clinical_agent = AgentExecutor(agent=clinical_agent_runnable, tools=CLINICAL_TOOLS, verbose=False)
+    if summary:
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + recent, update
+    return recent, update
 
 def receptionist_node(state: AgentState):
+    hops = state.get("hops", 0) + 1
     try:
-        user_query = ""
-        for msg in reversed(state.get("messages", [])):
-            if isinstance(msg, HumanMessage):
-                user_query = msg.content.lower()
-                break
-
-        medical_keywords = [
-            "swelling", "pain", "shortness of breath", "symptom", "medication",
-            "side effect", "diet", "dizziness", "fever", "blood", "urine", "rash"
-        ]
-
-        if any(k in user_query for k in medical_keywords):
-            ai_msg = AIMessage(content="HANDOFF_TO_CLINICAL")
-            return {"messages": [ai_msg], "current_agent": "Clinical Agent", "patient_report": state.get("patient_report", "")}
-
-        result = receptionist_agent.invoke(state)
+        messages = state.get("messages", [])
+        user_query = last_user_query(messages)
+
+        bounced_back = state.get("handoff") == "receptionist"
+        if not bounced_back and is_medical_query(user_query):
+            # Answer in the same graph step instead of emitting a routing message
+            # and paying for another step before the clinical agent even starts.
+            SYSTEM_LOGGER.info("HANDOFF: Receptionist -> Clinical Agent (medical keyword match, answered inline)")
+            return clinical_node(state)
+
+        history, history_update = bounded_history(state)
+        if is_trivial_query(user_query):
+            SYSTEM_LOGGER.info("AGENT: Receptionist using the small model for a short turn.")
+            agent = get_receptionist_agent(small=True)
+        else:
+            agent = get_receptionist_agent()
+        result = agent.invoke({**state, "messages": history})
         output_text = result.get("output", "")
         ai_message = AIMessage(content=output_text)
 
         patient_report = state.get("patient_report", "")
-        for msg in result.get("messages", []):
-            content = getattr(msg, "content", "")
-            if "patient_name" in content and "discharge_date" in content:
-                import json
+        for msg in reversed(result.get("messages", [])):
+            if not isinstance(msg, ToolMessage) or not isinstance(msg.content, str):
+                continue
+            if not PATIENT_REPORT_RE.match(msg.content):
+                continue
+            if msg.content != patient_report:
                 try:
-                    data = json.loads(content[content.find("{"): content.rfind("}") + 1])
-                    patient_report = json.dumps(data, indent=2)
-                except:
+                    patient_report = pretty_json(msg.content)
+                except ValueError:
                     pass
+            break
 
-        if "HANDOFF_TO_CLINICAL" in output_text:
-            return {"messages": [ai_message], "current_agent": "Clinical Agent", "patient_report": patient_report}
+        if handoff_target(result) == "clinical":
+            SYSTEM_LOGGER.info("HANDOFF: Receptionist -> Clinical Agent (handoff tool)")
+            # The routing output is control flow, not a reply; keep it out of the history.
+            return {"messages": [], "current_agent": "Clinical Agent", "patient_report": patient_report, "hops": hops, "handoff": "clinical", **history_update}
 
-        return {"messages": [ai_message], "current_agent": "Receptionist Agent", "patient_report": patient_report}
+        return {"messages": [ai_message], "current_agent": "Receptionist Agent", "patient_report": patient_report, "hops": hops, "handoff": "", **history_update}
 
     except Exception as e:
         error_msg = AIMessage(content=f"Error: {str(e)}")
-        return {"messages": [error_msg], "current_agent": "Receptionist Agent", "patient_report": state.get("patient_report", "")}
+        return {"messages": [error_msg], "current_agent": "Receptionist Agent", "patient_report": state.get("patient_report", ""), "hops": hops, "handoff": ""}
 
-def clinical_node(state: AgentState):
+class ClinicalState(TypedDict):
+    messages: List[BaseMessage]
+    patient_report: str
+    conversation_summary: str
+    summary_anchor_id: str
+    sections: Annotated[list, operator.add]
+    context: str
+    update: dict
+
+# Branches write (name, text) pairs; this fixes the order they are read in.
+SECTION_ORDER = ("patient_report", "rag_query_tool", "clinical_web_search")
+# Tool outputs that mean "nothing retrieved"; they must not reach the answer model as context.
+CONTEXT_MISS_PREFIXES = ("ERROR", "No relevant context found", "WEB SEARCH ERROR")
+CLINICAL_MAX_CONCURRENCY = 3
+
+# The clinical turn fans out to the independent retrieval branches (RAG, web
+# search, patient report), fans back in to compress, then answers. Retrieval
+# runs directly rather than as a tool round inside the agent, and the answer
+# model only sees the compressed context, which keeps its prefill small.
+def plan_clinical_retrieval(state: ClinicalState):
+    user_query = last_user_query(state.get("messages", []))
+    branches = ["rag"] if user_query else []
+    # Search alongside RAG when the question asks for recent material or the
+    # reference isn't loaded; otherwise only as a fallback after a RAG miss.
+    if user_query and (RAG_RETRIEVAL_CHAIN is None or SPECULATIVE_SEARCH_RE.search(user_query)):
+        SYSTEM_LOGGER.info("CLINICAL: Running RAG and web search in parallel.")
+        branches.append("search")
+    if state.get("patient_report"):
+        branches.append("report")
+    return branches or ["compress"]
+
+def _tool_section(name: str, clinical_tool, query: str) -> list:
     try:
-        result = clinical_agent.invoke(state)
-        output_text = result.get("output", "")
-        ai_message = AIMessage(content=output_text)
-
-        if "HANDOFF_TO_RECEPTIONIST" in output_text:
-            return {"messages": [ai_message], "current_agent": "Receptionist Agent", "patient_report": state.get("patient_report", "")}
+        return [(name, clinical_tool.invoke({"query": query}))]
+    except Exception as e:
+        SYSTEM_LOGGER.warning("CLINICAL: %s failed. Error: %s", name, e)
+        return []
+
+def clinical_rag(state: ClinicalState):
+    user_query = last_user_query(state.get("messages", []))
+    sections = _tool_section("rag_query_tool", rag_query_tool, user_query)
+    rag_missed = not sections or sections[0][1].startswith(CONTEXT_MISS_PREFIXES)
+    if rag_missed and RAG_RETRIEVAL_CHAIN is not None and not SPECULATIVE_SEARCH_RE.search(user_query):
+        SYSTEM_LOGGER.info("CLINICAL: No reference context, falling back to web search.")
+        sections += _tool_section("clinical_web_search", clinical_web_search, user_query)
+    return {"sections": sections}
+
+def clinical_search(state: ClinicalState):
+    user_query = last_user_query(state.get("messages", []))
+    return {"sections": _tool_section("clinical_web_search", clinical_web_search, user_query)}
+
+def clinical_report(state: ClinicalState):
+    return {"sections": [("patient_report", f"Patient discharge report:\n{state['patient_report']}")]}
+
+def clinical_compress(state: ClinicalState):
+    user_query = last_user_query(state.get("messages", []))
+    sections = sorted(state.get("sections", []), key=lambda section: SECTION_ORDER.index(section[0]))
+    sections = [(name, text) for name, text in sections if name == "patient_report" or not text.startswith(CONTEXT_MISS_PREFIXES)]
+    report = [text for name, text in sections if name == "patient_report"]
+    retrieved = "\n\n".join(f"{name}:\n{text}" for name, text in sections if name != "patient_report")
+    # The report is short and structured, so only retrieved material is compressed.
+    return {"context": "\n\n".join(report + ([compress_context(retrieved, user_query)] if retrieved else []))}
+
+def clinical_answer(state: ClinicalState):
+    history, history_update = bounded_history(state)
+    if state.get("context"):
+        history = history + [SystemMessage(content=CONTEXT_PREAMBLE + state["context"])]
+    result = get_clinical_agent().invoke({**state, "messages": history})
+    output_text = result.get("output", "")
+
+    if handoff_target(result) == "receptionist":
+        SYSTEM_LOGGER.info("HANDOFF: Clinical Agent -> Receptionist (handoff tool)")
+        current_agent, target, messages = "Receptionist Agent", "receptionist", []
+    else:
+        current_agent, target, messages = "Clinical Agent", "", [AIMessage(content=output_text)]
+    return {"update": {"messages": messages, "current_agent": current_agent, "patient_report": state.get("patient_report", ""), "handoff": target, **history_update}}
+
+@functools.cache
+def get_clinical_graph():
+    workflow = StateGraph(ClinicalState)
+    workflow.add_node("rag", clinical_rag)
+    workflow.add_node("search", clinical_search)
+    workflow.add_node("report", clinical_report)
+    workflow.add_node("compress", clinical_compress)
+    workflow.add_node("answer", clinical_answer)
+    workflow.add_conditional_edges(START, plan_clinical_retrieval, ["rag", "search", "report", "compress"])
+    for branch in ("rag", "search", "report"):
+        workflow.add_edge(branch, "compress")
+    workflow.add_edge("compress", "answer")
+    workflow.add_edge("answer", END)
+    return workflow.compile()
 
-        return {"messages": [ai_message], "current_agent": "Clinical Agent", "patient_report": state.get("patient_report", "")}
+def clinical_node(state: AgentState):
+    hops = state.get("hops", 0) + 1
+    try:
+        update = get_clinical_graph().invoke(state, config={"max_concurrency": CLINICAL_MAX_CONCURRENCY})["update"]
+        return {**update, "hops": hops}
 
     except Exception as e:
+        SYSTEM_LOGGER.exception("CLINICAL: Subgraph failed.")
         error_msg = AIMessage(content=f"Medical processing error: {str(e)}")
-        return {"messages": [error_msg], "current_agent": "Clinical Agent", "patient_report": state.get("patient_report", "")}
-
-def route_agent(state: AgentState) -> str:
-    current_agent = state.get("current_agent", "Receptionist Agent")
-    messages = state.get("messages", [])
+        return {"messages": [error_msg], "current_agent": "Clinical Agent", "patient_report": state.get("patient_report", ""), "hops": hops, "handoff": ""}
 
-    if len(messages) >= 2 and isinstance(messages[-1], AIMessage):
-        content = messages[-1].content
-        if "HANDOFF_TO_CLINICAL" in content:
-            return "clinical_agent_node"
-        if "HANDOFF_TO_RECEPTIONIST" in content:
-            return "receptionist_agent_node"
-        if len(content) > 15:
-            return END
-
-    return "clinical_agent_node" if current_agent == "Clinical Agent" else "receptionist_agent_node"
-
-workflow = StateGraph(AgentState)
-workflow.add_node("receptionist_agent_node", receptionist_node)
-workflow.add_node("clinical_agent_node", clinical_node)
-workflow.set_entry_point("receptionist_agent_node")
-
-workflow.add_conditional_edges(
-    "receptionist_agent_node",
-    route_agent,
-    {"clinical_agent_node": "clinical_agent_node", "receptionist_agent_node": "receptionist_agent_node", END: END}
-)
+def handoff_limit_node(state: AgentState):
+    # Handoff turns add no message, so without this the user would be shown
+    # their own question (or nothing) as the reply.
+    return {"messages": [AIMessage(content=HANDOFF_LIMIT_REPLY)], "handoff": ""}
 
-workflow.add_conditional_edges(
-    "clinical_agent_node",
-    route_agent,
-    {"receptionist_agent_node": "receptionist_agent_node", "clinical_agent_node": "clinical_agent_node", END: END}
-)
+def route_agent(state: AgentState) -> str:
+    target = HANDOFF_NODES.get(state.get("handoff"), END)
+    if target != END and state.get("hops", 0) > MAX_HOPS:
+        SYSTEM_LOGGER.warning("ROUTING: Handoff limit reached for this turn, ending with a fallback reply.")
+        return "handoff_limit_node"
+    return target
+
+# Conversations kept in memory at once; the least recently active is dropped
+# first (e.g. sessions that ended without their thread being released).
+MAX_CHECKPOINT_THREADS = int(os.getenv("MAX_CHECKPOINT_THREADS", "256"))
+
+class LatestCheckpointSaver(MemorySaver):
+    """
+    MemorySaver that keeps only what resuming a conversation needs: the newest
+    root checkpoint of each thread, with its pending writes and channel blobs,
+    for at most max_threads threads. Plain MemorySaver keeps every checkpoint
+    (several per turn, each holding the full message list) plus those of every
+    nested agent/subgraph run, so memory grows with every turn.
+    """
+
+    def __init__(self, max_threads: int = MAX_CHECKPOINT_THREADS):
+        super().__init__()
+        self.max_threads = max_threads
+        self._threads = OrderedDict()
+        self._lock = threading.RLock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            self._prune(thread_id, checkpoint_ns, checkpoint["id"], checkpoint["channel_versions"])
+            self._threads[thread_id] = None
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > self.max_threads:
+                self.delete_thread(next(iter(self._threads)))
+            return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+    def _prune(self, thread_id, checkpoint_ns, keep_id, channel_versions):
+        namespaces = self.storage[thread_id]
+        # A root checkpoint is written once a step's tasks have all finished,
+        # so the nested namespaces of their agent/subgraph runs are dead.
+        dropped_ns = [ns for ns in namespaces if ns != checkpoint_ns] if checkpoint_ns == "" else []
+        for ns in dropped_ns:
+            del namespaces[ns]
+        checkpoints = namespaces[checkpoint_ns]
+        for checkpoint_id in [c for c in checkpoints if c != keep_id]:
+            del checkpoints[checkpoint_id]
+        for key in [k for k in self.writes if k[0] == thread_id and (k[1] in dropped_ns or (k[1] == checkpoint_ns and k[2] != keep_id))]:
+            del self.writes[key]
+        for key in [k for k in self.blobs if k[0] == thread_id and (k[1] in dropped_ns or (k[1] == checkpoint_ns and channel_versions.get(k[2]) != k[3]))]:
+            del self.blobs[key]
+
+# Conversation state per thread_id, kept in process memory. With a thread_id,
+# callers pass only the new turn (e.g. {"messages": [HumanMessage(...)]}) and
+# the rest of the state is restored from the last checkpoint. Without one the
+# state passed in is the whole conversation and a throwaway thread is used.
+# Callers release a conversation with CHECKPOINTER.delete_thread(thread_id).
+CHECKPOINTER = LatestCheckpointSaver()
+
+@functools.cache
+def get_app():
+    workflow = StateGraph(AgentState)
+    workflow.add_node("receptionist_agent_node", receptionist_node)
+    workflow.add_node("clinical_agent_node", clinical_node)
+    workflow.add_node("handoff_limit_node", handoff_limit_node)
+    workflow.set_entry_point("receptionist_agent_node")
+    workflow.add_edge("handoff_limit_node", END)
+
+    workflow.add_conditional_edges(
+        "receptionist_agent_node",
+        route_agent,
+        {"clinical_agent_node": "clinical_agent_node", "receptionist_agent_node": "receptionist_agent_node", "handoff_limit_node": "handoff_limit_node", END: END}
+    )
+
+    workflow.add_conditional_edges(
+        "clinical_agent_node",
+        route_agent,
+        {"receptionist_agent_node": "receptionist_agent_node", "clinical_agent_node": "clinical_agent_node", "handoff_limit_node": "handoff_limit_node", END: END}
+    )
+
+    return workflow.compile(checkpointer=CHECKPOINTER)
+
+def _new_turn(state: AgentState) -> AgentState:
+    return {**state, "hops": 0, "handoff": ""}
+
+@contextlib.contextmanager
+def _run_config(thread_id: str = None):
+    temporary = thread_id is None
+    if temporary:
+        thread_id = uuid.uuid4().hex
+    try:
+        yield {"recursion_limit": RECURSION_LIMIT, "configurable": {"thread_id": thread_id}}
+    finally:
+        if temporary:
+            CHECKPOINTER.delete_thread(thread_id)
 
-app = workflow.compile()
+def invoke_app(state: AgentState, thread_id: str = None):
+    try:
+        with _run_config(thread_id) as config:
+            return get_app().invoke(_new_turn(state), config=config)
+    except Exception:
+        return state
 
-def invoke_app(state: AgentState):
+async def ainvoke_app(state: AgentState, thread_id: str = None):
+    """
+    Async counterpart of invoke_app. Concurrent sessions awaited on one event
+    loop keep their LLM requests in flight together, which a batching model
+    server (vLLM, TGI) can serve as one continuous batch.
+    """
     try:
-        return app.invoke(state, config={"recursion_limit": 10})
+        with _run_config(thread_id) as config:
+            return await get_app().ainvoke(_new_turn(state), config=config)
     except Exception:
         return state
+
+def stream_app(state: AgentState, thread_id: str = None):
+    """
+    Runs the graph like invoke_app but yields ("token", text) pairs as the LLM
+    decodes, followed by a single ("state", final_state) once the run ends.
+    """
+    final_state = state
+    with _run_config(thread_id) as config:
+        try:
+            events = get_app().stream(_new_turn(state), config=config, stream_mode=["messages", "values"], subgraphs=True)
+            for namespace, mode, payload in events:
+                if mode == "values":
+                    if not namespace:
+                        final_state = payload
+                    continue
+                chunk, _metadata = payload
+                if isinstance(chunk, AIMessageChunk) and chunk.content:
+                    yield "token", chunk.content
+        except Exception:
+            SYSTEM_LOGGER.exception("Graph streaming failed.")
+    yield "state", final_state
+
@@ -1,16 +1,21 @@
 # app.py
+import hashlib
 import os
+import queue
+import sys
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
 import streamlit as st
-from langchain_core.messages import HumanMessage
-import rag_setup
-import agent_workflow
 
-from agent_workflow import AgentState, invoke_app, MEDICAL_DISCLAIMER
-from logging_setup import SYSTEM_LOGGER
-from tools import get_patient_discharge_report
+# agent_workflow and rag_setup pull in LangChain, Chroma and the embedding
+# model; they are imported on first use so the page renders before they load.
+from prompts import MEDICAL_DISCLAIMER
+from logging_setup import SYSTEM_LOGGER, flush_logs
 
 st.set_page_config(
     page_title="DataSmith AI - Post-Discharge Assistant",
@@ -19,8 +24,12 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-st.markdown(
-    """
+@st.cache_resource
+def app_css() -> str:
+    # Solid message backgrounds: gradients on every past message make long chats
+    # expensive to composite. The status dots, the header one included, only
+    # pulse while a turn is running.
+    return """
     <style>
     .main { background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); }
     .main-header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 2rem; border-radius: 15px; margin-bottom: 2rem; box-shadow: 0 4px 6px rgba(0,0,0,0.1); color: white; text-align: center; }
@@ -29,20 +38,21 @@ st.markdown(
     .medical-disclaimer { background: linear-gradient(135deg,#ffecd2 0%,#fcb69f 100%); padding:1.5rem; border-radius:10px; border-left:5px solid #ff6b6b; margin-bottom:2rem; box-shadow:0 2px 4px rgba(0,0,0,0.1); }
     .medical-disclaimer strong { color:#c92a2a; font-size:1.1rem; }
     .stChatMessage { padding:1rem; border-radius:15px; margin-bottom:1rem; }
-    [data-testid="stChatMessage"][aria-label*="user"] { background: linear-gradient(135deg,#667eea 0%,#764ba2 100%); color: white; }
-    [data-testid="stChatMessage"][aria-label*="assistant"] { background: linear-gradient(135deg,#f093fb 0%,#f5576c 100%); color: white; }
+    [data-testid="stChatMessage"][aria-label*="user"] { background: #6f5fc7; color: white; }
+    [data-testid="stChatMessage"][aria-label*="assistant"] { background: #f2677f; color: white; }
     .stChatInputContainer { background: white; border-radius:25px; padding:1rem; box-shadow:0 4px 6px rgba(0,0,0,0.1); }
     .css-1d391kg { background: linear-gradient(180deg,#667eea 0%,#764ba2 100%); }
     .stButton>button { background: linear-gradient(135deg,#667eea 0%,#764ba2 100%); color:white; border:none; border-radius:20px; padding:0.5rem 2rem; font-weight:bold; transition:all .3s ease; }
     .stButton>button:hover { transform: translateY(-2px); box-shadow:0 4px 8px rgba(0,0,0,0.2); }
     .streamlit-expanderHeader { background: linear-gradient(135deg,#667eea 0%,#764ba2 100%); color:white; border-radius:10px; padding:1rem; }
-    .status-indicator { display:inline-block; width:12px; height:12px; border-radius:50%; background:#51cf66; margin-right:8px; animation:pulse 2s infinite; }
+    .status-indicator { display:inline-block; width:12px; height:12px; border-radius:50%; background:#51cf66; margin-right:8px; }
+    .status-indicator.pulsing, body:has(.status-indicator.pulsing) .main-header .status-indicator { animation:pulse 2s infinite; }
     @keyframes pulse { 0%{opacity:1;}50%{opacity:0.5;}100%{opacity:1;} }
     .info-card { background:white; padding:1.5rem; border-radius:10px; box-shadow:0 2px 4px rgba(0,0,0,0.1); margin-bottom:1rem; border-left:4px solid #667eea; }
     </style>
-    """,
-    unsafe_allow_html=True
-)
+    """
+
+st.markdown(app_css(), unsafe_allow_html=True)
 
 st.markdown(
     """
@@ -66,37 +76,183 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+@st.cache_resource(show_spinner="Loading the nephrology reference...")
+def get_rag_chain(rebuild: bool = False):
+    # One vector store and embedding model per process, shared by every session and rerun.
+    import rag_setup
+    return rag_setup.setup_rag_retriever(
+        source_file=None,
+        persist_directory=rag_setup.CHROMA_DB_PATH,
+        rebuild=rebuild
+    )
+
+def ensure_rag_chain():
+    # Load an already-built store before the first turn; building one stays behind the sidebar button.
+    import agent_workflow
+    import rag_setup
+    if agent_workflow.RAG_RETRIEVAL_CHAIN is None and os.path.exists(rag_setup.CHROMA_DB_PATH) and "rag_load_failed" not in st.session_state:
+        try:
+            agent_workflow.RAG_RETRIEVAL_CHAIN = get_rag_chain()
+        except Exception:
+            st.session_state["rag_load_failed"] = True
+            SYSTEM_LOGGER.exception("RAG load error")
+
+@st.cache_resource
+def get_agent_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def get_upload_executor():
+    # Separate from the agent pool so a save never queues behind running turns.
+    return ThreadPoolExecutor(max_workers=1)
+
+REF_PATH = "nephrology_reference.pdf"
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+def _save_upload(uploaded, path, progress):
+    # Runs on a worker thread: copies in chunks and hashes in the same pass.
+    digest = hashlib.sha256()
+    uploaded.seek(0)
+    with open(path, "wb") as f:
+        while chunk := uploaded.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+            f.write(chunk)
+            progress["written"] += len(chunk)
+    return digest.hexdigest()
+
+def _source_marker_path():
+    import rag_setup
+    return os.path.join(rag_setup.CHROMA_DB_PATH, "source.sha256")
+
+def _read_source_marker():
+    try:
+        with open(_source_marker_path()) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _write_source_marker(source_sha256):
+    # Rewritten on every rebuild: a store built without a known upload must not
+    # keep the marker of an earlier PDF, or a later rebuild could be skipped.
+    path = _source_marker_path()
+    if source_sha256:
+        with open(path, "w") as f:
+            f.write(source_sha256)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+@st.fragment(run_every="0.5s")
+def upload_status():
+    # Polls the background save without blocking the script; only this fragment reruns.
+    pending = st.session_state["pending_upload"]
+    future = pending["future"]
+    if not future.done():
+        st.progress(min(pending["progress"]["written"] / max(pending["size"], 1), 1.0), text="Saving reference...")
+        return
+    del st.session_state["pending_upload"]
+    # Recorded on failure too, so the same file isn't resubmitted on every rerun.
+    st.session_state["ref_upload_id"] = pending["file_id"]
+    try:
+        st.session_state["ref_sha256"] = future.result()
+    except Exception as e:
+        SYSTEM_LOGGER.exception("Reference upload save failed")
+        st.session_state["ref_upload_error"] = str(e)
+    # A full rerun stops this fragment's timer and re-enables the rebuild button.
+    st.rerun()
+
 with st.sidebar:
     st.markdown("---")
     st.markdown("### 📚 Nephrology Reference (RAG)")
     st.caption("Upload a large nephrology PDF (optional) to use as the internal RAG reference.")
     uploaded_ref = st.file_uploader("Upload nephrology_reference.pdf (optional)", type=["pdf"], key="ref_upload")
 
-    if uploaded_ref is not None:
-        ref_path = "nephrology_reference.pdf"
-        with open(ref_path, "wb") as f:
-            f.write(uploaded_ref.getbuffer())
-        st.success(f"Reference uploaded: {ref_path}")
+    # The uploader hands the same file back on every rerun; only write it once.
+    pending_upload = st.session_state.get("pending_upload")
+    if (uploaded_ref is not None and st.session_state.get("ref_upload_id") != uploaded_ref.file_id
+            and (pending_upload is None or pending_upload["file_id"] != uploaded_ref.file_id)):
+        progress = {"written": 0}
+        st.session_state["ref_sha256"] = None
+        st.session_state["pending_upload"] = pending_upload = {
+            "future": get_upload_executor().submit(_save_upload, uploaded_ref, REF_PATH, progress),
+            "progress": progress,
+            "size": uploaded_ref.size,
+            "file_id": uploaded_ref.file_id,
+        }
+    if pending_upload is not None:
+        upload_status()
+    elif "ref_upload_error" in st.session_state:
+        st.error(f"Failed to save reference: {st.session_state.pop('ref_upload_error')}")
+    elif uploaded_ref is not None:
+        st.success(f"Reference uploaded: {REF_PATH}")
 
     st.markdown("**Rebuild/Load RAG DB**")
-    if st.button("Rebuild RAG (create embeddings)", key="rebuild_rag"):
+    if st.button("Rebuild RAG (create embeddings)", key="rebuild_rag", disabled=pending_upload is not None):
         try:
-            with st.spinner("Building or loading RAG vectorstore (this may take several minutes)..."):
-                chain = rag_setup.setup_rag_retriever(
-                    source_file=None,
-                    persist_directory=rag_setup.CHROMA_DB_PATH,
-                    rebuild=True
-                )
-                agent_workflow.RAG_RETRIEVAL_CHAIN = chain
-            st.success("RAG vector store created and loaded.")
+            import agent_workflow
+            source_sha256 = st.session_state.get("ref_sha256")
+            if source_sha256 and source_sha256 == _read_source_marker():
+                # Same PDF as the existing store: skip the embedding rebuild.
+                agent_workflow.RAG_RETRIEVAL_CHAIN = get_rag_chain()
+                st.success("Reference unchanged; existing RAG vector store loaded.")
+            else:
+                with st.spinner("Building or loading RAG vectorstore (this may take several minutes)..."):
+                    get_rag_chain.clear()
+                    agent_workflow.RAG_RETRIEVAL_CHAIN = get_rag_chain(rebuild=True)
+                _write_source_marker(source_sha256)
+                st.success("RAG vector store created and loaded.")
         except Exception as e:
             st.error(f"Failed to build RAG: {e}")
             SYSTEM_LOGGER.exception("RAG build error")
 
+STREAM_FLUSH_SECONDS = 0.2
+
+def _run_turn(turn, thread_id, token_queue):
+    # Runs on a worker thread: no st.* calls here, tokens go through the queue.
+    from agent_workflow import stream_app
+    final_state = turn
+    for kind, payload in stream_app(turn, thread_id=thread_id):
+        if kind == "token":
+            token_queue.put(payload)
+        else:
+            final_state = payload
+    return final_state
+
+def _drain(token_queue, tokens):
+    drained = False
+    while True:
+        try:
+            tokens.append(token_queue.get_nowait())
+        except queue.Empty:
+            return drained
+        drained = True
+
+def _release_thread(thread_id):
+    # agent_workflow is only imported once the session has run a turn.
+    workflow = sys.modules.get("agent_workflow")
+    if workflow is not None:
+        workflow.CHECKPOINTER.delete_thread(thread_id)
+
+class SessionThread:
+    """Checkpoint thread of one browser session, released when Streamlit drops the session."""
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        weakref.finalize(self, _release_thread, self.id)
+
+# Rendered chat transcript only; the history sent to the LLM is trimmed and
+# summarised separately in agent_workflow.
+MAX_UI_MESSAGES = 500
+
 if "messages" not in st.session_state:
-    st.session_state["messages"] = []
+    st.session_state["messages"] = deque(maxlen=MAX_UI_MESSAGES)
 
 if "agent_state" not in st.session_state:
+    # The graph checkpoints the conversation under this session's thread_id;
+    # agent_state only keeps the last result for display.
+    st.session_state["session_thread"] = SessionThread()
+    st.session_state["thread_id"] = st.session_state["session_thread"].id
     st.session_state["agent_state"] = {
         "messages": [],
         "current_agent": "Receptionist Agent",
@@ -110,52 +266,100 @@ if "agent_state" not in st.session_state:
         )
     })
 
-st.markdown("### 💬 Conversation")
-chat_container = st.container()
-with chat_container:
-    for message in st.session_state["messages"]:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+@st.fragment(run_every=STREAM_FLUSH_SECONDS)
+def turn_status():
+    # Polls the running turn like upload_status: each tick reruns only this
+    # fragment and flushes the tokens streamed so far as plain text. The final
+    # answer is rendered as markdown by the full rerun once the turn ends.
+    pending = st.session_state["pending"]
+    future = pending["future"]
+    if not future.done():
+        _drain(pending["queue"], pending["tokens"])
+        with st.chat_message("assistant"):
+            st.caption(pending["label"])
+            if pending["tokens"]:
+                st.text("".join(pending["tokens"]))
+        return
 
-prompt = st.chat_input("Type your message here... (e.g., 'My name is John Smith' or 'What are my medications?')")
-if prompt:
-    st.session_state["messages"].append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.markdown(prompt)
+    final_state = st.session_state["agent_state"]
+    try:
+        final_state = future.result()
+    except Exception as e:
+        SYSTEM_LOGGER.exception("Failed when streaming agent graph.")
+        st.session_state["turn_error"] = f"❌ Agent error: {e}"
 
-    st.session_state["agent_state"]["messages"].append(HumanMessage(content=prompt))
+    assistant_response = "I'm sorry, I didn't receive a response. Please try again."
+    try:
+        messages = final_state.get("messages", [])
+        if messages:
+            last_msg = messages[-1]
+            if hasattr(last_msg, "content"):
+                assistant_response = last_msg.content
+            elif isinstance(last_msg, dict):
+                assistant_response = last_msg.get("content", str(last_msg))
+            else:
+                assistant_response = str(last_msg)
+    except Exception as e:
+        SYSTEM_LOGGER.exception("Error extracting assistant response: %s", e)
+        assistant_response = "I encountered an error processing your request. Please try again."
 
-    current_agent = st.session_state["agent_state"].get("current_agent", "Receptionist Agent")
-    agent_emoji = "👨‍⚕️" if "Clinical" in current_agent else "👋"
+    st.session_state["agent_state"] = final_state
+    st.session_state["messages"].append({"role": "assistant", "content": assistant_response})
+    del st.session_state["pending"]
+    st.rerun()
 
-    with st.spinner(f"{agent_emoji} {current_agent} is processing your request..."):
-        try:
-            final_state = invoke_app(st.session_state["agent_state"])
-        except Exception as e:
-            SYSTEM_LOGGER.exception("Failed when invoking agent graph.")
-            st.error(f"❌ Agent error: {e}")
-            final_state = st.session_state["agent_state"]
+# The chat is a fragment: submitting a message reruns only this panel, not
+# the header, sidebar, footer or log viewer.
+@st.fragment
+def chat_panel():
+    # Filled in below, once it is known whether this run starts or continues a turn.
+    heading = st.empty()
+    chat_container = st.container()
+    with chat_container:
+        for message in st.session_state["messages"]:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
 
-        assistant_response = "I'm sorry, I didn't receive a response. Please try again."
-        try:
-            messages = final_state.get("messages", [])
-            if messages:
-                last_msg = messages[-1]
-                if hasattr(last_msg, "content"):
-                    assistant_response = last_msg.content
-                elif isinstance(last_msg, dict):
-                    assistant_response = last_msg.get("content", str(last_msg))
-                else:
-                    assistant_response = str(last_msg)
-        except Exception as e:
-            SYSTEM_LOGGER.exception(f"Error extracting assistant response: {e}")
-            assistant_response = "I encountered an error processing your request. Please try again."
+    pending = st.session_state.get("pending")
+    prompt = st.chat_input(
+        "Type your message here... (e.g., 'My name is John Smith' or 'What are my medications?')",
+        disabled=pending is not None
+    )
+    if prompt and pending is None:
+        st.session_state["messages"].append({"role": "user", "content": prompt})
+        with st.chat_message("user"):
+            st.markdown(prompt)
 
-        st.session_state["agent_state"] = final_state
-        st.session_state["messages"].append({"role": "assistant", "content": assistant_response})
+        from langchain_core.messages import HumanMessage
+        ensure_rag_chain()
 
-        with st.chat_message("assistant"):
-            st.markdown(assistant_response)
+        current_agent = st.session_state["agent_state"].get("current_agent", "Receptionist Agent")
+        agent_emoji = "👨‍⚕️" if "Clinical" in current_agent else "👋"
+
+        # The turn runs on a worker thread, so sidebar actions can rerun the
+        # script meanwhile; the next run picks the pending turn up again below.
+        token_queue = queue.Queue()
+        pending = {
+            "future": get_agent_executor().submit(
+                _run_turn, {"messages": [HumanMessage(content=prompt)]}, st.session_state["thread_id"], token_queue
+            ),
+            "queue": token_queue,
+            "tokens": [],
+            "label": f"{agent_emoji} {current_agent} is processing your request...",
+        }
+        st.session_state["pending"] = pending
+
+    # The dot pulses while a turn is pending; the full rerun when the turn
+    # ends redraws it without the class.
+    pulse_class = " pulsing" if pending is not None else ""
+    heading.markdown(f'### <span class="status-indicator{pulse_class}"></span>💬 Conversation', unsafe_allow_html=True)
+    turn_error = st.session_state.pop("turn_error", None)
+    if turn_error:
+        st.error(turn_error)
+    if pending is not None:
+        turn_status()
+
+chat_panel()
 
 st.markdown("---")
 col1, col2, col3 = st.columns(3)
@@ -190,18 +394,37 @@ with col3:
         """
     )
 
-with st.expander("🔍 System Logs & Diagnostics", expanded=False):
-    try:
-        with open("system_logs.log", "r", encoding="utf-8") as f:
-            log_content = f.read()
+LOG_TAIL_BYTES = 64 * 1024
+
+@st.cache_data(max_entries=4)
+def read_log_tail(path: str, size: int, mtime: float) -> str:
+    # size and mtime are part of the cache key: an unchanged log is not re-read.
+    with open(path, "rb") as f:
+        f.seek(max(0, size - LOG_TAIL_BYTES))
+        data = f.read(LOG_TAIL_BYTES)
+    text = data.decode("utf-8", "replace")
+    if size > LOG_TAIL_BYTES:
+        text = text.split("\n", 1)[-1]
+    return text
+
+# Refreshes on its own timer instead of on every chat or sidebar rerun.
+@st.fragment(run_every="5s")
+def log_panel():
+    with st.expander("🔍 System Logs & Diagnostics", expanded=False):
+        try:
+            flush_logs()
+            log_stat = os.stat("system_logs.log")
+            log_content = read_log_tail("system_logs.log", log_stat.st_size, log_stat.st_mtime)
             if log_content:
                 st.code(log_content, language="text")
             else:
                 st.info("No logs generated yet. System is ready.")
-    except FileNotFoundError:
-        st.info("System logs not yet generated.")
-    except Exception as e:
-        st.warning(f"Could not read logs: {e}")
+        except FileNotFoundError:
+            st.info("System logs not yet generated.")
+        except Exception as e:
+            st.warning(f"Could not read logs: {e}")
+
+log_panel()
 
 st.markdown(
     """
@@ -1,6 +1,12 @@
 import json
 from datetime import datetime, timedelta
-import random
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def create_dummy_data(num_patients=35):
     """Generates a diverse dictionary of dummy patient discharge reports."""
@@ -142,51 +148,61 @@ def create_dummy_data(num_patients=35):
         "Transplant clinic in 2 weeks"
     ]
     
+    genders = ["Male", "Female", "Other"]
+    admission_reasons = [
+        "Routine check-up",
+        "Worsening kidney function",
+        "Acute symptoms",
+        "Medication adjustment",
+        "Dialysis initiation",
+        "Post-surgical care",
+        "Infection management"
+    ]
+    
+    # Sample every per-patient choice up front in one vectorised draw each
+    rng = np.random.default_rng()
+    # Unique names: draw without replacement from every first/last combination
+    name_pool = list(dict.fromkeys(f"{first} {last}" for first in first_names for last in last_names))
+    names = [name_pool[i] for i in rng.choice(len(name_pool), size=num_patients, replace=False)]
+    diag_idx = rng.integers(len(diagnoses_data), size=num_patients).tolist()
+    follow_up_idx = rng.integers(len(follow_up_options), size=num_patients).tolist()
+    now = datetime.now()
+    discharge_dates = [(now - timedelta(days=days)).strftime("%Y-%m-%d") for days in rng.integers(0, 61, size=num_patients).tolist()]
+    ages = rng.integers(25, 86, size=num_patients).tolist()
+    gender_idx = rng.integers(len(genders), size=num_patients).tolist()
+    reason_idx = rng.integers(len(admission_reasons), size=num_patients).tolist()
+    # 70% of patients have lab values
+    has_labs = (rng.random(num_patients) > 0.3).tolist()
+    creatinine = np.round(rng.uniform(1.2, 8.5, num_patients), 2).tolist()
+    egfr = rng.integers(8, 61, size=num_patients).tolist()
+    potassium = np.round(rng.uniform(3.5, 6.2, num_patients), 1).tolist()
+    sodium = rng.integers(135, 146, size=num_patients).tolist()
+    
     patient_data = {}
-    used_names = set()
     
-    for i in range(num_patients):
-        # Generate unique name
-        while True:
-            first = random.choice(first_names)
-            last = random.choice(last_names)
-            name = f"{first} {last}"
-            if name not in used_names:
-                used_names.add(name)
-                break
-        
-        # Select diagnosis data
-        diag_data = random.choice(diagnoses_data)
+    for i, name in enumerate(names):
+        diag_data = diagnoses_data[diag_idx[i]]
         
         # Create report with variations
         report = {
-            "discharge_date": (datetime.now() - timedelta(days=random.randint(0, 60))).strftime("%Y-%m-%d"),
+            "discharge_date": discharge_dates[i],
             "primary_diagnosis": diag_data["diagnosis"],
             "medications": diag_data["medications"].copy(),
             "dietary_restrictions": diag_data["dietary"],
-            "follow_up": random.choice(follow_up_options),
+            "follow_up": follow_up_options[follow_up_idx[i]],
             "warning_signs": diag_data["warning_signs"],
             "discharge_instructions": diag_data["instructions"],
-            "age": random.randint(25, 85),
-            "gender": random.choice(["Male", "Female", "Other"]),
-            "admission_reason": random.choice([
-                "Routine check-up",
-                "Worsening kidney function",
-                "Acute symptoms",
-                "Medication adjustment",
-                "Dialysis initiation",
-                "Post-surgical care",
-                "Infection management"
-            ])
+            "age": ages[i],
+            "gender": genders[gender_idx[i]],
+            "admission_reason": admission_reasons[reason_idx[i]]
         }
         
-        # Add lab values for some patients
-        if random.random() > 0.3:  # 70% of patients have lab values
+        if has_labs[i]:
             report["recent_labs"] = {
-                "creatinine": round(random.uniform(1.2, 8.5), 2),
-                "eGFR": random.randint(8, 60),
-                "potassium": round(random.uniform(3.5, 6.2), 1),
-                "sodium": random.randint(135, 145)
+                "creatinine": creatinine[i],
+                "eGFR": egfr[i],
+                "potassium": potassium[i],
+                "sodium": sodium[i]
             }
         
         patient_data[name] = report
@@ -196,8 +212,12 @@ def create_dummy_data(num_patients=35):
 # Generate and save the data
 if __name__ == "__main__":
     DUMMY_PATIENT_DATA = create_dummy_data(35)
-    with open("patient_data.json", "w") as f:
-        json.dump(DUMMY_PATIENT_DATA, f, indent=4)
+    if orjson is not None:
+        with open("patient_data.json", "wb") as f:
+            f.write(orjson.dumps(DUMMY_PATIENT_DATA, option=orjson.OPT_INDENT_2))
+    else:
+        with open("patient_data.json", "w") as f:
+            json.dump(DUMMY_PATIENT_DATA, f, indent=2)
     
     print(f"patient_data.json created with {len(DUMMY_PATIENT_DATA)} records.")
     print(f"Diagnoses included: {set([p['primary_diagnosis'] for p in DUMMY_PATIENT_DATA.values()])}")
@@ -1,32 +1,49 @@
 import logging
+import logging.handlers
 import os
 
 LOG_FILE = "system_logs.log"
+# Records are buffered and written in batches; ERROR and above are written at once.
+LOG_BUFFER_CAPACITY = 1024
 
-if os.path.exists(LOG_FILE):
-    try:
-        os.remove(LOG_FILE)
-    except (PermissionError, OSError):
+SYSTEM_LOGGER = logging.getLogger('SystemFlow')
+# LOG_LEVEL=WARNING drops the per-turn INFO records before they are formatted;
+# an unrecognised value falls back to INFO rather than failing the import.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+if not isinstance(logging.getLevelName(LOG_LEVEL), int):
+    LOG_LEVEL = "INFO"
+SYSTEM_LOGGER.setLevel(LOG_LEVEL)
+
+# Streamlit re-imports changed modules in the same process; the logger is
+# process-global, so only the first import resets the file and attaches handlers.
+if not SYSTEM_LOGGER.handlers:
+    if os.path.exists(LOG_FILE):
         try:
-            with open(LOG_FILE, 'w') as f:
-                f.write('')
+            os.remove(LOG_FILE)
         except (PermissionError, OSError):
-            pass
+            try:
+                with open(LOG_FILE, 'w') as f:
+                    f.write('')
+            except (PermissionError, OSError):
+                pass
 
-SYSTEM_LOGGER = logging.getLogger('SystemFlow')
-SYSTEM_LOGGER.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        rotating_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=5_000_000, backupCount=3)
+        rotating_handler.setFormatter(formatter)
+        file_handler = logging.handlers.MemoryHandler(LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=rotating_handler)
+        SYSTEM_LOGGER.addHandler(file_handler)
+    except (PermissionError, OSError) as e:
+        print(f"Warning: Could not create log file handler: {e}. Using console logging only.")
 
-try:
-    file_handler = logging.FileHandler(LOG_FILE, mode='a')
-    file_handler.setFormatter(formatter)
-    SYSTEM_LOGGER.addHandler(file_handler)
-except (PermissionError, OSError) as e:
-    print(f"Warning: Could not create log file handler: {e}. Using console logging only.")
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    SYSTEM_LOGGER.addHandler(console_handler)
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-SYSTEM_LOGGER.addHandler(console_handler)
+    SYSTEM_LOGGER.info("SYSTEM INITIALIZED: Comprehensive logging started.")
 
-SYSTEM_LOGGER.info("SYSTEM INITIALIZED: Comprehensive logging started.")
\ No newline at end of file
+def flush_logs():
+    """Writes buffered records to LOG_FILE, e.g. before displaying it."""
+    for handler in SYSTEM_LOGGER.handlers:
+        handler.flush()
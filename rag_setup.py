@@ -1,8 +1,19 @@
+import functools
+import operator
 import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from typing import Dict
 from dotenv import load_dotenv
 load_dotenv()
 
+# Let the fast tokenizer use every core when encoding ingest batches
+# (set before tokenizers is imported; an explicit user setting wins).
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
 try:
     from langchain.document_loaders import PyPDFLoader, TextLoader
 except Exception:
@@ -12,6 +23,7 @@ except Exception:
         PyPDFLoader = None
         from langchain_community.document_loaders import TextLoader
 
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 try:
@@ -24,13 +36,35 @@ try:
 except ImportError:
     from langchain_community.vectorstores import Chroma
 
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from langgraph.constants import TAG_NOSTREAM
 
 DEFAULT_SOURCE_FILE_TXT = "nephrology_reference.txt"
 DEFAULT_SOURCE_FILE_PDF = "nephrology_reference.pdf"
 CHROMA_DB_PATH = "chroma_db"
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Any sentence-transformers bi-encoder, e.g. "BAAI/bge-small-en-v1.5". Changing
+# it requires rebuilding the Chroma DB; semantic cache rows of the old model are dropped.
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# Lives next to the vector store it caches answers for (and is git-ignored).
+SEMANTIC_CACHE_DB_NAME = "semantic_cache.sqlite3"
+SEMANTIC_CACHE_DB_PATH = os.path.join(CHROMA_DB_PATH, SEMANTIC_CACHE_DB_NAME)
+# Same collection name langchain-chroma uses, so existing DBs keep loading.
+CHROMA_COLLECTION_NAME = "langchain"
+# Only applied when the collection is created. A smaller construction_ef speeds
+# up the index build; recall is recovered by the fetch_k + MMR rerank.
+CHROMA_HNSW_METADATA = {"hnsw:construction_ef": 64, "hnsw:M": 16}
+# Chunks embedded and written per step during ingest.
+INGEST_BATCH_SIZE = 1000
+# Candidates below this cosine similarity to the query are not sent to the
+# LLM; an all-irrelevant result counts as a miss and falls back to web search.
+MIN_RELEVANCE = float(os.getenv("RAG_MIN_RELEVANCE", "0.2"))
 
 RAG_LLM = ChatOpenAI(
     model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
@@ -38,21 +72,237 @@ RAG_LLM = ChatOpenAI(
     api_key=os.getenv("OPENAI_API_KEY")
 )
 
+class SemanticCache:
+    """
+    Caches RAG answers keyed by query embedding. A lookup returns the stored
+    answer of the closest cached query when its cosine similarity reaches the
+    threshold. Entries expire after ttl_seconds, the least recently used entry
+    is evicted past max_entries, and everything is mirrored to SQLite so the
+    cache survives restarts. Rows are tagged with the embedding model and
+    dimension; rows written by a different model are dropped on load.
+    """
+
+    def __init__(self, embeddings, db_path=SEMANTIC_CACHE_DB_PATH, threshold=0.95, max_entries=256, ttl_seconds=24 * 3600, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model_name", EMBEDDING_MODEL_NAME)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        # Routing and retrieval embed the same user turn; encode it once.
+        self.embed = functools.lru_cache(maxsize=64)(self._embed)
+        # Also the warm-up encode, so the first user question doesn't pay for model initialisation.
+        self.dimension = int(self.embed("warm up").shape[0])
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(semantic_cache)")]
+        if columns and "model" not in columns:
+            # Written before rows were tagged; their model is unknown.
+            self._conn.execute("DROP TABLE semantic_cache")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_cache "
+            "(query TEXT PRIMARY KEY, embedding BLOB NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, "
+            "model TEXT NOT NULL, dim INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._conn.execute(
+            "DELETE FROM semantic_cache WHERE created_at < ? OR model != ? OR dim != ?",
+            (cutoff, self.model_name, self.dimension)
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT query, embedding, answer, created_at FROM semantic_cache ORDER BY created_at"
+        ).fetchall()
+        for query, blob, answer, created_at in rows[-self.max_entries:]:
+            self._entries[query] = (np.frombuffer(blob, dtype=np.float32), answer, created_at)
+
+    def _embed(self, query: str):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+        self._conn.executemany("DELETE FROM semantic_cache WHERE query = ?", [(key,) for key in keys])
+        self._conn.commit()
+        self._matrix = None
+
+    def lookup(self, query: str):
+        """Returns (query_vector, cached_answer); cached_answer is None on a miss."""
+        vector = self.embed(query)
+        with self._lock:
+            cutoff = time.time() - self.ttl_seconds
+            expired = [key for key, (_, _, created_at) in self._entries.items() if created_at < cutoff]
+            if expired:
+                self._evict(expired)
+            if not self._entries:
+                return vector, None
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key][0] for key in self._matrix_keys])
+            scores = self._matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return vector, None
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            return vector, self._entries[key][1]
+
+    def insert(self, query: str, vector, answer: str):
+        with self._lock:
+            created_at = time.time()
+            self._entries[query] = (vector, answer, created_at)
+            self._entries.move_to_end(query)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO semantic_cache (query, embedding, answer, created_at, model, dim) VALUES (?, ?, ?, ?, ?, ?)",
+                (query, vector.astype(np.float32).tobytes(), answer, created_at, self.model_name, self.dimension)
+            )
+            self._conn.commit()
+            self._matrix = None
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._evict(list(self._entries)[:overflow])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.embed.cache_clear()
+            self._conn.execute("DELETE FROM semantic_cache")
+            self._conn.commit()
+
+def mmr(query_embedding, doc_embeddings, k: int, lambda_mult: float = 0.5):
+    """
+    Maximal marginal relevance over unit-norm embeddings. Relevance is one
+    matrix-vector product; each pick updates every candidate's redundancy
+    with one more, so selection is k vectorised steps.
+    """
+    doc_embeddings = np.asarray(doc_embeddings, dtype=np.float32)
+    if len(doc_embeddings) == 0:
+        return []
+    relevance = doc_embeddings @ np.asarray(query_embedding, dtype=np.float32)
+    redundancy = np.zeros(len(doc_embeddings), dtype=np.float32)
+    selected = np.zeros(len(doc_embeddings), dtype=bool)
+    picks = []
+    for _ in range(min(k, len(doc_embeddings))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        picks.append(best)
+        selected[best] = True
+        redundancy = np.maximum(redundancy, doc_embeddings @ doc_embeddings[best])
+    return picks
+
+class NativeChromaStore:
+    """
+    chromadb collection queried directly: one col.query fetches fetch_k
+    candidates with their embeddings, those under min_relevance are dropped,
+    and mmr() picks the k returned.
+    """
+
+    def __init__(self, collection, embeddings, fetch_k=20, lambda_mult=0.5, max_batch_size=INGEST_BATCH_SIZE, min_relevance=MIN_RELEVANCE):
+        self.collection = collection
+        self.embeddings = embeddings
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.max_batch_size = max_batch_size
+        self.min_relevance = min_relevance
+
+    def add_documents(self, docs):
+        # Embed and write one batch at a time, so only one batch of vectors is
+        # held in memory; the encoder batches internally (see get_embeddings).
+        for start in range(0, len(docs), self.max_batch_size):
+            batch = docs[start:start + self.max_batch_size]
+            texts = [d.page_content for d in batch]
+            self.collection.add(
+                ids=[str(uuid.uuid4()) for _ in batch],
+                documents=texts,
+                metadatas=[d.metadata or None for d in batch],
+                embeddings=self.embeddings.embed_documents(texts),
+            )
+            print(f"Embedded {min(start + self.max_batch_size, len(docs))}/{len(docs)} chunks")
+
+    def similarity_search(self, query: str, k: int = 3):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 3):
+        result = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=max(k, self.fetch_k),
+            include=["documents", "metadatas", "embeddings"],
+        )
+        texts = result["documents"][0]
+        if not texts:
+            return []
+        metadatas = result["metadatas"][0] or [None] * len(texts)
+        candidates = np.asarray(result["embeddings"][0], dtype=np.float32)
+        relevant = np.flatnonzero(candidates @ np.asarray(embedding, dtype=np.float32) >= self.min_relevance)
+        picks = mmr(embedding, candidates[relevant], k, self.lambda_mult)
+        return [Document(page_content=texts[i], metadata=metadatas[i] or {}) for i in relevant[picks].tolist()]
+
+_PAGE_CONTENT = operator.attrgetter("page_content")
+
 class SimpleRetrievalChain:
-    def __init__(self, vectorstore, llm, chunk_size=1000, k=3):
+    def __init__(self, vectorstore, llm, chunk_size=1000, k=3, semantic_cache=None, retrieval_cache_size=512):
         self.vectorstore = vectorstore
         self.llm = llm
         self.k = k
+        self.semantic_cache = semantic_cache
+        # Retrieved documents per query, so repeat questions skip Chroma even when
+        # the answer itself isn't in the semantic cache. A rebuilt store gets a new
+        # chain, which starts with an empty cache.
+        self.retrieval_cache_size = retrieval_cache_size
+        self._retrieval_cache = OrderedDict()
+        self._retrieval_lock = threading.Lock()
         self.rag_prompt = ChatPromptTemplate.from_messages([
             ("system", "You are a clinical assistant specializing in nephrology. Answer the user's question based ONLY on the provided reference material. Always cite your sources by referencing the specific sections you used. If the reference material doesn't contain enough information to answer the question, say so clearly."),
             ("human", "Reference Material:\n{context}\n\nQuestion: {question}\n\nAnswer the question based on the reference material above. Include citations by referencing the relevant sections.")
         ])
 
-    def invoke(self, inputs: Dict):
-        query = inputs.get("input", "") if isinstance(inputs, dict) else str(inputs)
+    @staticmethod
+    def _retrieval_key(query: str, query_vector):
+        # int8-rounded unit embedding: equal only for (near-)identical queries.
+        if query_vector is not None:
+            return np.round(np.asarray(query_vector, dtype=np.float32) * 127).astype(np.int8).tobytes()
+        return " ".join(query.lower().split())
+
+    def clear_cache(self):
+        with self._retrieval_lock:
+            self._retrieval_cache.clear()
+
+    def retrieve(self, query: str, query_vector=None):
+        key = self._retrieval_key(query, query_vector)
+        with self._retrieval_lock:
+            docs = self._retrieval_cache.get(key)
+            if docs is not None:
+                self._retrieval_cache.move_to_end(key)
+                return docs
+        docs = self._search(query, query_vector)
+        if docs:
+            with self._retrieval_lock:
+                self._retrieval_cache[key] = docs
+                while len(self._retrieval_cache) > self.retrieval_cache_size:
+                    self._retrieval_cache.popitem(last=False)
+        return docs
+
+    def _search(self, query: str, query_vector=None):
         docs = []
         try:
-            if hasattr(self.vectorstore, "similarity_search"):
+            if query_vector is not None and hasattr(self.vectorstore, "max_marginal_relevance_search_by_vector"):
+                # LangChain Chroma fallback: diverse picks rather than k near-duplicates.
+                docs = self.vectorstore.max_marginal_relevance_search_by_vector(np.asarray(query_vector).tolist(), k=self.k, fetch_k=4 * self.k)
+            elif query_vector is not None and hasattr(self.vectorstore, "similarity_search_by_vector"):
+                docs = self.vectorstore.similarity_search_by_vector(np.asarray(query_vector).tolist(), k=self.k)
+            elif hasattr(self.vectorstore, "similarity_search"):
                 docs = self.vectorstore.similarity_search(query, k=self.k)
             elif hasattr(self.vectorstore, "similarity_search_with_score"):
                 docs = [d for d, _ in self.vectorstore.similarity_search_with_score(query, k=self.k)]
@@ -64,36 +314,63 @@ class SimpleRetrievalChain:
                     docs = retr.get_relevant_documents_by_query(query)
         except Exception:
             docs = []
+        return docs
+
+    @staticmethod
+    def _doc_content(d) -> str:
+        # Retrieved items are Documents in practice; the other shapes are fallbacks.
+        try:
+            return _PAGE_CONTENT(d)
+        except AttributeError:
+            pass
+        if isinstance(d, dict) and "page_content" in d:
+            return d["page_content"]
+        if hasattr(d, "content"):
+            return d.content
+        return str(d)
+
+    def invoke(self, inputs: Dict):
+        query = inputs.get("input", "") if isinstance(inputs, dict) else str(inputs)
+        query_vector = inputs.get("query_vector") if isinstance(inputs, dict) else None
+        docs = self.retrieve(query, query_vector)
 
         if not docs:
             return {"output": "No relevant context found in the local nephrology reference. Please try rephrasing or allow web search."}
 
-        context_pieces = []
-        for i, d in enumerate(docs, 1):
-            if hasattr(d, "page_content"):
-                content = d.page_content
-            elif isinstance(d, dict) and "page_content" in d:
-                content = d["page_content"]
-            elif hasattr(d, "content"):
-                content = d.content
-            else:
-                content = str(d)
-            context_pieces.append(f"[Section {i}]\n{content[:2000]}")
-
-        context = "\n\n---\n\n".join(context_pieces)
+        context = "\n\n---\n\n".join(f"[Section {i}]\n{self._doc_content(d)[:2000]}" for i, d in enumerate(docs, 1))
 
         try:
-            chain = self.rag_prompt | self.llm
+            # Internal generation step: its tokens must not leak into the chat stream.
+            chain = (self.rag_prompt | self.llm).with_config(tags=[TAG_NOSTREAM])
             response = chain.invoke({"context": context, "question": query})
             if hasattr(response, "content"):
                 answer = response.content
             else:
                 answer = str(response)
             answer_with_citation = f"{answer}\n\n[Source: Internal Nephrology Reference - {len(docs)} section(s) retrieved]"
-            return {"output": answer_with_citation}
+            return {"output": answer_with_citation, "source_documents": docs}
         except Exception as e:
             return {"output": f"Retrieved context:\n{context}\n\n[Source: Internal Nephrology Reference] - (LLM generation failed with error: {e})"}
 
+def _embedding_model_kwargs() -> dict:
+    # torch comes with sentence-transformers; imported here to keep module import cheap.
+    import torch
+    if not torch.cuda.is_available():
+        return {"device": "cpu"}
+    # fp16 on GPU roughly doubles encoder throughput; output is re-normalised anyway.
+    return {"device": "cuda", "model_kwargs": {"torch_dtype": torch.float16}}
+
+@functools.lru_cache(maxsize=None)
+def get_embeddings(model_name: str = EMBEDDING_MODEL_NAME):
+    """One embedding model per process, shared by ingest, queries and the semantic cache."""
+    # Unit-norm output keeps the semantic cache's vectors identical to what the
+    # store would compute, so they can be reused for the similarity search.
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=_embedding_model_kwargs(),
+        encode_kwargs={"batch_size": 128, "normalize_embeddings": True}
+    )
+
 def _load_documents_from_file(source_file: str):
     ext = os.path.splitext(source_file)[1].lower()
     if ext == ".pdf":
@@ -107,6 +384,22 @@ def _load_documents_from_file(source_file: str):
     return documents
 
 def setup_rag_retriever(source_file: str = None, persist_directory: str = CHROMA_DB_PATH, rebuild: bool = False, chunk_size: int = 1000, chunk_overlap: int = 100):
+    """
+    Returns the retrieval chain for persist_directory. Loading is memoised per
+    argument set, so repeat calls reuse the Chroma client and semantic cache;
+    rebuild=True always re-ingests and drops the memoised chains.
+    """
+    if rebuild:
+        _load_rag_retriever.cache_clear()
+        return _build_rag_retriever(source_file, persist_directory, True, chunk_size, chunk_overlap)
+    return _load_rag_retriever(source_file, persist_directory, chunk_size, chunk_overlap)
+
+@functools.lru_cache(maxsize=4)
+def _load_rag_retriever(source_file, persist_directory, chunk_size, chunk_overlap):
+    return _build_rag_retriever(source_file, persist_directory, False, chunk_size, chunk_overlap)
+
+def _split_source(source_file, chunk_size, chunk_overlap):
+    # Parsing a 1500-page PDF takes a while; only done when the store is (re)built.
     if source_file is None:
         if os.path.exists(DEFAULT_SOURCE_FILE_PDF):
             source_file = DEFAULT_SOURCE_FILE_PDF
@@ -119,15 +412,29 @@ def setup_rag_retriever(source_file: str = None, persist_directory: str = CHROMA
     documents = _load_documents_from_file(source_file)
 
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    docs = text_splitter.split_documents(documents)
+    return text_splitter.split_documents(documents)
 
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+def _build_rag_retriever(source_file, persist_directory, rebuild, chunk_size, chunk_overlap):
+    embeddings = get_embeddings()
 
-    if os.path.exists(persist_directory) and not rebuild:
+    if chromadb is not None:
+        client = chromadb.PersistentClient(path=persist_directory)
+        if rebuild and CHROMA_COLLECTION_NAME in [getattr(c, "name", c) for c in client.list_collections()]:
+            client.delete_collection(CHROMA_COLLECTION_NAME)
+        collection = client.get_or_create_collection(CHROMA_COLLECTION_NAME, metadata=CHROMA_HNSW_METADATA)
+        vectorstore = NativeChromaStore(collection, embeddings, max_batch_size=min(INGEST_BATCH_SIZE, client.get_max_batch_size()))
+        if collection.count() == 0:
+            print("Creating Chroma vectorstore (this may take a while for a 1500-page PDF)...")
+            vectorstore.add_documents(_split_source(source_file, chunk_size, chunk_overlap))
+            print(f"Vector store saved to: {persist_directory}")
+        else:
+            print(f"Loading existing Chroma DB from: {persist_directory}")
+    elif os.path.exists(persist_directory) and not rebuild:
         print(f"Loading existing Chroma DB from: {persist_directory}")
         vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
     else:
         print("Creating Chroma vectorstore (this may take a while for a 1500-page PDF)...")
+        docs = _split_source(source_file, chunk_size, chunk_overlap)
         vectorstore = Chroma.from_documents(documents=docs, embedding=embeddings, persist_directory=persist_directory)
         try:
             vectorstore.persist()
@@ -135,7 +442,11 @@ def setup_rag_retriever(source_file: str = None, persist_directory: str = CHROMA
             pass
         print(f"Vector store saved to: {persist_directory}")
 
-    retrieval_chain = SimpleRetrievalChain(vectorstore, RAG_LLM, chunk_size=chunk_size, k=3)
+    semantic_cache = SemanticCache(embeddings, db_path=os.path.join(persist_directory, SEMANTIC_CACHE_DB_NAME))
+    if rebuild:
+        semantic_cache.clear()
+
+    retrieval_chain = SimpleRetrievalChain(vectorstore, RAG_LLM, chunk_size=chunk_size, k=3, semantic_cache=semantic_cache)
     return retrieval_chain
 
 RAG_RETRIEVAL_CHAIN = None
\ No newline at end of file
@@ -0,0 +1,58 @@
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent_workflow
+
+
+class BouncingAgent:
+    """Fake agent that always hands the turn to the other agent."""
+
+    def __init__(self, target):
+        self.target = target
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        return {"output": f"HANDOFF_TO_{self.target.upper()}", "messages": []}
+
+
+class NoSearch:
+    def invoke(self, inputs):
+        return "No relevant context found."
+
+
+class HandoffLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.receptionist = BouncingAgent("clinical")
+        self.clinical = BouncingAgent("receptionist")
+        patches = [
+            mock.patch.object(agent_workflow, "get_receptionist_agent", lambda small=False: self.receptionist),
+            mock.patch.object(agent_workflow, "get_clinical_agent", lambda: self.clinical),
+            mock.patch.object(agent_workflow, "clinical_web_search", NoSearch()),
+            mock.patch.object(agent_workflow, "is_medical_query", lambda text: False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_ping_pong_ends_with_fallback_reply(self):
+        state = {"messages": [HumanMessage(content="Could you look into my situation please?")],
+                 "current_agent": "Receptionist Agent", "patient_report": ""}
+        final = agent_workflow.invoke_app(state)
+
+        self.assertGreater(final["hops"], agent_workflow.MAX_HOPS)
+        self.assertEqual(self.receptionist.calls + self.clinical.calls, agent_workflow.MAX_HOPS + 1)
+        reply = final["messages"][-1]
+        self.assertIsInstance(reply, AIMessage)
+        self.assertEqual(reply.content, agent_workflow.HANDOFF_LIMIT_REPLY)
+        for message in final["messages"]:
+            self.assertNotIn("HANDOFF_TO_", message.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
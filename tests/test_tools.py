@@ -0,0 +1,46 @@
+import os
+import unittest
+
+from tools import get_patient_db, get_patient_discharge_report
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PatientLookupTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # get_patient_db reads patient_data.json from the working directory.
+        cwd = os.getcwd()
+        os.chdir(REPO_ROOT)
+        try:
+            get_patient_db.cache_clear()
+            get_patient_db()
+        finally:
+            os.chdir(cwd)
+
+    def lookup(self, name):
+        return get_patient_discharge_report.invoke({"patient_name": name})
+
+    def test_partial_name_inside_another_surname_is_ambiguous(self):
+        # "John" is a whole token of John Hall and a substring of Charles Johnson.
+        result = self.lookup("John")
+        self.assertTrue(result.startswith("ERROR: Multiple patients"), result)
+        self.assertIn("John Hall", result)
+        self.assertIn("Charles Johnson", result)
+
+    def test_ambiguous_list_includes_substring_matches(self):
+        result = self.lookup("Robert")
+        self.assertTrue(result.startswith("ERROR: Multiple patients"), result)
+        for name in ("Robert Hall", "Robert Davis", "Elizabeth Roberts"):
+            self.assertIn(name, result)
+
+    def test_exact_name_returns_report(self):
+        result = self.lookup("charles johnson")
+        self.assertIn('"patient_name": "Charles Johnson"', result)
+
+    def test_unknown_name_is_not_found(self):
+        self.assertIn("not found", self.lookup("Nobody Atall"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,78 +1,154 @@
+import asyncio
+import functools
 import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pydantic import BaseModel, Field
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool, tool
 
 from logging_setup import SYSTEM_LOGGER
 db_logger = SYSTEM_LOGGER.getChild("database_access")
 
 try:
-    with open("patient_data.json", "r") as f:
-        PATIENT_DATABASE = json.load(f)
-except FileNotFoundError:
-    print("FATAL: patient_data.json not found. Run Step 1.1 script first.")
-    PATIENT_DATABASE = {}
+    import orjson
+except ImportError:
+    orjson = None
+
+def _report_json(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+# The patient file is read on the first lookup, not at import.
+@functools.lru_cache(maxsize=1)
+def get_patient_db() -> dict:
+    try:
+        with open("patient_data.json", "rb") as f:
+            return orjson.loads(f.read()) if orjson is not None else json.load(f)
+    except FileNotFoundError:
+        print("FATAL: patient_data.json not found. Run Step 1.1 script first.")
+        return {}
+
+@functools.lru_cache(maxsize=1)
+def _name_indexes():
+    # Lowercased name -> stored name, so exact (case-insensitive) lookups are one dict hit.
+    name_index = {name.lower(): name for name in get_patient_db()}
+    name_items = list(name_index.items())
+    # Name token -> entries containing it, to shortlist partial-name matches.
+    token_index = defaultdict(list)
+    for item in name_items:
+        for token in set(item[0].split()):
+            token_index[token].append(item)
+    return name_index, name_items, token_index
+
+# Reports never change while the process runs, so each is serialized once.
+@functools.lru_cache(maxsize=None)
+def _patient_report_json(exact_name: str) -> str:
+    return _report_json({"patient_name": exact_name, **get_patient_db()[exact_name]})
 
 class PatientLookupInput(BaseModel):
-    patient_name: str = Field(description="The full name of the patient (e.g., 'John Smith').")
+    patient_name: str = Field(description="Patient's full name, e.g. 'John Smith'.")
 
 @tool(args_schema=PatientLookupInput)
 def get_patient_discharge_report(patient_name: str) -> str:
-    """
-    Retrieves the complete post-discharge report for a patient given their full name.
+    """Get a patient's discharge report as JSON. Returns an ERROR if the patient is not found or the name matches multiple patients."""
     
-    Returns a JSON string of the report or an error message if not found.
-    Handles error cases (patient not found, multiple matches). 
-    """
-    
-    db_logger.info(f"Attempting to retrieve report for: {patient_name}")
+    db_logger.info("Attempting to retrieve report for: %s", patient_name)
     
+    name_index, name_items, token_index = _name_indexes()
     patient_name_lower = patient_name.lower().strip()
-    matches = []
-    
-    for db_name in PATIENT_DATABASE.keys():
-        if db_name.lower() == patient_name_lower:
-            matches.append(db_name)
-        elif patient_name_lower in db_name.lower() or db_name.lower() in patient_name_lower:
-            matches.append(db_name)
+    exact_name = name_index.get(patient_name_lower)
     
-    if len(matches) > 1:
-        db_logger.warning(f"ERROR: Multiple patients found matching '{patient_name}': {matches}")
-        return f"ERROR: Multiple patients found with similar names: {', '.join(matches)}. Please provide the full exact name."
-    
-    if len(matches) == 1:
+    if exact_name is None:
+        # Partial names: substring match either way, e.g. "Smith" or "Mr John Smith".
+        # Unique / ambiguous / not found is decided over every entry ("John" also
+        # matches "Charles Johnson"); the token index only lists entries sharing
+        # a whole name token first.
+        matches = [db_name for db_lower, db_name in name_items if patient_name_lower in db_lower or db_lower in patient_name_lower]
+        if len(matches) > 1:
+            whole_token = {db_name for token in patient_name_lower.split() for _, db_name in token_index.get(token, ())}
+            matches.sort(key=lambda db_name: db_name not in whole_token)
+        
+        if len(matches) > 1:
+            db_logger.warning("ERROR: Multiple patients found matching '%s': %s", patient_name, matches)
+            return f"ERROR: Multiple patients found with similar names: {', '.join(matches)}. Please provide the full exact name."
+        
+        if not matches:
+            db_logger.warning("ERROR: Patient not found: %s", patient_name)
+            return f"ERROR: Patient '{patient_name}' not found in the database. Please check the spelling or confirm the patient's identity."
+        
         exact_name = matches[0]
-        report = PATIENT_DATABASE[exact_name]
-        db_logger.info(f"SUCCESS: Report retrieved for {exact_name}.")
-        return json.dumps({"patient_name": exact_name, **report}, indent=2)
     
-    db_logger.warning(f"ERROR: Patient not found: {patient_name}")
-    return f"ERROR: Patient '{patient_name}' not found in the database. Please check the spelling or confirm the patient's identity."
+    db_logger.info("SUCCESS: Report retrieved for %s.", exact_name)
+    return _patient_report_json(exact_name)
 
 from langchain_community.tools import DuckDuckGoSearchRun
 
 class WebSearchInput(BaseModel):
-    query: str = Field(description="The search query to execute (e.g., 'latest research on SGLT2 inhibitors for kidney disease').")
+    query: str = Field(description="Search query.")
+
+# Built on the first web search rather than at import.
+@functools.lru_cache(maxsize=1)
+def get_ddg_search():
+    return DuckDuckGoSearchRun()
 
-ddg_search = DuckDuckGoSearchRun()
+WEB_SEARCH_TIMEOUT = 5.0
+# Identical searches within the same hour are answered from memory.
+WEB_SEARCH_CACHE_SECONDS = 3600
+# Sync calls wait on a worker so a rate-limited DDG request can't stall the agent;
+# a timed-out search keeps its worker until DDG returns.
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+WEB_SEARCH_ERROR = "WEB SEARCH ERROR: I was unable to perform the external search. Please try rephrasing your query."
 
-@tool(args_schema=WebSearchInput)
-def clinical_web_search(query: str) -> str:
-    """
-    Performs a real-time web search for information outside the internal
-    nephrology reference book, specifically for latest research or external
-    clinical data.
-    """
+@functools.lru_cache(maxsize=512)
+def _cached_search(query_key: str, time_bucket: int) -> str:
+    # time_bucket is part of the key so entries expire; failures are not cached.
+    return get_ddg_search().run(query_key)
+
+def _search(query: str) -> str:
+    return _cached_search(" ".join(query.lower().split()), int(time.time() // WEB_SEARCH_CACHE_SECONDS))
+
+def _web_search_response(results: str) -> str:
+    db_logger.info("WEB SEARCH SUCCESS: Results obtained.")
+    return f"WEB SEARCH RESULTS (Source: General Internet Search):\n{results}"
+
+def _clinical_web_search(query: str) -> str:
+    """General web search for recent research or clinical data not in the nephrology reference book."""
     
-    db_logger.info(f"WEB SEARCH: Attempting search for query: '{query}'")
+    db_logger.info("WEB SEARCH: Attempting search for query: '%s'", query)
     
     try:
-        results = ddg_search.run(query)
-        response = f"WEB SEARCH RESULTS (Source: General Internet Search):\n{results}"
-        db_logger.info("WEB SEARCH SUCCESS: Results obtained.")
-        return response
+        return _web_search_response(_SEARCH_EXECUTOR.submit(_search, query).result(timeout=WEB_SEARCH_TIMEOUT))
     
+    except FutureTimeoutError:
+        db_logger.error("WEB SEARCH ERROR: Search timed out after %ss.", WEB_SEARCH_TIMEOUT)
+        return WEB_SEARCH_ERROR
     except Exception as e:
-        db_logger.error(f"WEB SEARCH ERROR: Failed to execute search. Error: {e}")
-        return "WEB SEARCH ERROR: I was unable to perform the external search. Please try rephrasing your query."
+        db_logger.error("WEB SEARCH ERROR: Failed to execute search. Error: %s", e)
+        return WEB_SEARCH_ERROR
+
+async def _aclinical_web_search(query: str) -> str:
+    # Used by ainvoke/astream callers: the search runs on a worker thread and
+    # is abandoned after WEB_SEARCH_TIMEOUT so a stalled request can't hold the run.
+    db_logger.info("WEB SEARCH: Attempting search for query: '%s'", query)
+    
+    try:
+        results = await asyncio.wait_for(asyncio.to_thread(_search, query), timeout=WEB_SEARCH_TIMEOUT)
+        return _web_search_response(results)
+    
+    except asyncio.TimeoutError:
+        db_logger.error("WEB SEARCH ERROR: Search timed out after %ss.", WEB_SEARCH_TIMEOUT)
+        return WEB_SEARCH_ERROR
+    except Exception as e:
+        db_logger.error("WEB SEARCH ERROR: Failed to execute search. Error: %s", e)
+        return WEB_SEARCH_ERROR
+
+clinical_web_search = StructuredTool.from_function(
+    func=_clinical_web_search,
+    coroutine=_aclinical_web_search,
+    name="clinical_web_search",
+    args_schema=WebSearchInput,
+)
 
 # CLINICAL_TOOLS = [rag_chain_tool, clinical_web_search]
\ No newline at end of file
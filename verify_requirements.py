@@ -1,263 +1,396 @@
+import importlib.util
 import json
 import os
+import re
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TOP_LEVEL = re.compile(rb"\n(?=\S)")
+# Every file the checks read is known up front; all of them are prefetched.
+MANIFEST = ("patient_data.json", "agent_workflow.py", "rag_setup.py", "tools.py", "app.py")
+READ_CHUNK = 1 << 20
+# One pass per prompt; (?i:...) keeps the matching case-insensitive only where it always was.
+RECEPTIONIST_PROBES = re.compile(
+    r"(?P<name>Ask patient for their name|Greet the patient)"
+    r"|(?P<follow_up>(?i:follow-up questions))"
+    r"|(?P<routing>handoff tool with target 'clinical')"
+)
+CLINICAL_PROBES = re.compile(r"(?i:citation|source)")
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# One directory listing answers every "does it exist" question below.
+with os.scandir(".") as it:
+    ENTRIES: Dict[str, bool] = {entry.name: entry.is_dir() for entry in it}
+
+# Start the manifest reads up front; each section only waits on the ones it needs.
+# Files missing from the snapshot are not submitted and fail in read_bytes() instead.
+PREFETCH_POOL = ThreadPoolExecutor(max_workers=4)
+PREFETCH: Dict[str, Future] = {os.path.abspath(p): PREFETCH_POOL.submit(_read, p)
+                               for p in MANIFEST if ENTRIES.get(p) is False}
+
+
+def read_bytes(path: str) -> bytes:
+    """Return a file's bytes, from the prefetch if one was started for it."""
+    future = PREFETCH.pop(os.path.abspath(path), None)
+    return future.result() if future is not None else _read(path)
+
+
+# Status lines are collected per section and written in one call.
+report: List[str] = []
+
+
+def flush_report() -> None:
+    if report:
+        sys.stdout.write("\n".join(report) + "\n")
+        sys.stdout.flush()
+        report.clear()
+
+
+def count_lines(path: str) -> Tuple[int, int]:
+    """Return ``(lines, size)`` for a file, streaming it in fixed-size chunks."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        lines = size = 0
+        last = b"\n"
+        while True:
+            chunk = os.read(fd, READ_CHUNK)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+            last = chunk[-1:]
+    finally:
+        os.close(fd)
+    # readlines() also counts a final line that has no trailing newline.
+    return lines + (last != b"\n"), size
+
+
+def function_source(src: bytes, name: bytes) -> bytes:
+    """Slice a top-level function out of source bytes without importing it."""
+    start = src.find(b"\ndef " + name + b"(")
+    if start < 0:
+        raise LookupError(f"{name.decode()} not found")
+    end = TOP_LEVEL.search(src, start + 1)
+    return src[start:end.start() if end else len(src)]
 
-print("=" * 60)
-print("ASSIGNMENT REQUIREMENTS VERIFICATION")
-print("=" * 60)
 
-all_passed = True
+def module_source(name: str) -> bytes:
+    """Read a module's source as bytes without executing it."""
+    path = f"{name}.py"
+    if path in MANIFEST and ENTRIES.get(path) is False:
+        return read_bytes(path)
+    spec = importlib.util.find_spec(name)
+    if spec is None or not spec.origin:
+        raise ImportError(f"No module named '{name}'")
+    return read_bytes(spec.origin)
+
+
+def module_list(src: bytes, name: bytes) -> bytes:
+    """Return the body of a module-level ``NAME = [...]`` assignment."""
+    match = re.search(rb"^" + name + rb"\s*=\s*\[([^\]]*)\]", src, re.M)
+    return match.group(1) if match else b""
 
-print("\n1. DATA SETUP")
-print("-" * 60)
 
 try:
-    with open("patient_data.json", "r") as f:
-        patient_data = json.load(f)
+    workflow_src: bytes = module_source("agent_workflow")
+except (ImportError, OSError):
+    workflow_src = b""
+
+
+def check_patient_data() -> bool:
+    patient_bytes = read_bytes("patient_data.json")
+    patient_data = orjson.loads(patient_bytes) if orjson is not None else json.loads(patient_bytes)
     patient_count = len(patient_data)
     if patient_count >= 25:
-        print(f"[OK] Patient data: {patient_count} patients (Requirement: 25+)")
-    else:
-        print(f"[FAIL] Patient data: {patient_count} patients (Requirement: 25+)")
-        all_passed = False
-except Exception as e:
-    print(f"[FAIL] Patient data file error: {e}")
-    all_passed = False
+        report.append(f"[OK] Patient data: {patient_count} patients (Requirement: 25+)")
+        return True
+    report.append(f"[FAIL] Patient data: {patient_count} patients (Requirement: 25+)")
+    return False
 
-try:
-    if os.path.exists("nephrology_reference.txt"):
-        size = os.path.getsize("nephrology_reference.txt")
-        with open("nephrology_reference.txt", "r") as f:
-            lines = len(f.readlines())
-        print(f"[OK] Nephrology reference: {lines} lines, {size} bytes")
+
+def check_nephrology_reference() -> bool:
+    try:
+        lines, size = count_lines("nephrology_reference.txt")
+    except FileNotFoundError:
+        report.append("[FAIL] Nephrology reference file not found")
+        return False
+    report.append(f"[OK] Nephrology reference: {lines} lines, {size} bytes")
+    return True
+
+
+def check_storage() -> bool:
+    passed = True
+    if "patient_data.json" in ENTRIES:
+        report.append("[OK] Database storage: JSON file format")
     else:
-        print("[FAIL] Nephrology reference file not found")
-        all_passed = False
-except Exception as e:
-    print(f"[FAIL] Nephrology reference error: {e}")
-    all_passed = False
-
-if os.path.exists("patient_data.json"):
-    print("[OK] Database storage: JSON file format")
-else:
-    print("[FAIL] Database storage: Not found")
-    all_passed = False
+        report.append("[FAIL] Database storage: Not found")
+        passed = False
 
-if os.path.exists("chroma_db"):
-    print("[OK] Vector embeddings: ChromaDB directory exists")
-else:
-    print("[WARN] Vector embeddings: ChromaDB directory not found (will be created on first run)")
+    if ENTRIES.get("chroma_db"):
+        report.append("[OK] Vector embeddings: ChromaDB directory exists")
+    else:
+        report.append("[WARN] Vector embeddings: ChromaDB directory not found (will be created on first run)")
+    return passed
 
-print("\n2. MULTI-AGENT SYSTEM")
-print("-" * 60)
 
-try:
-    from agent_workflow import RECEPTIONIST_SYSTEM_PROMPT, RECEPTIONIST_TOOLS
-    if "get_patient_discharge_report" in str(RECEPTIONIST_TOOLS):
-        print("[OK] Receptionist Agent: Configured with patient retrieval tool")
+def check_receptionist() -> bool:
+    from prompts import RECEPTIONIST_SYSTEM_PROMPT
+    passed = True
+    receptionist_found = {m.lastgroup for m in RECEPTIONIST_PROBES.finditer(RECEPTIONIST_SYSTEM_PROMPT)}
+    if b"get_patient_discharge_report" in module_list(workflow_src, b"RECEPTIONIST_TOOLS"):
+        report.append("[OK] Receptionist Agent: Configured with patient retrieval tool")
     else:
-        print("[FAIL] Receptionist Agent: Missing patient retrieval tool")
-        all_passed = False
+        report.append("[FAIL] Receptionist Agent: Missing patient retrieval tool")
+        passed = False
     
-    if "Ask patient for their name" in RECEPTIONIST_SYSTEM_PROMPT or "Greet the patient" in RECEPTIONIST_SYSTEM_PROMPT:
-        print("[OK] Receptionist Agent: Asks for patient name")
+    if "name" in receptionist_found:
+        report.append("[OK] Receptionist Agent: Asks for patient name")
     else:
-        print("[FAIL] Receptionist Agent: Missing name request in prompt")
-        all_passed = False
+        report.append("[FAIL] Receptionist Agent: Missing name request in prompt")
+        passed = False
     
-    if "follow-up questions" in RECEPTIONIST_SYSTEM_PROMPT.lower():
-        print("[OK] Receptionist Agent: Configured to ask follow-up questions")
+    if "follow_up" in receptionist_found:
+        report.append("[OK] Receptionist Agent: Configured to ask follow-up questions")
     else:
-        print("[FAIL] Receptionist Agent: Missing follow-up questions in prompt")
-        all_passed = False
+        report.append("[FAIL] Receptionist Agent: Missing follow-up questions in prompt")
+        passed = False
     
-    if "HANDOFF_TO_CLINICAL" in RECEPTIONIST_SYSTEM_PROMPT:
-        print("[OK] Receptionist Agent: Routes to Clinical Agent")
+    if "routing" in receptionist_found:
+        report.append("[OK] Receptionist Agent: Routes to Clinical Agent")
     else:
-        print("[FAIL] Receptionist Agent: Missing routing to Clinical Agent")
-        all_passed = False
-except Exception as e:
-    print(f"[FAIL] Receptionist Agent check failed: {e}")
-    all_passed = False
+        report.append("[FAIL] Receptionist Agent: Missing routing to Clinical Agent")
+        passed = False
+    return passed
 
-try:
-    from agent_workflow import CLINICAL_SYSTEM_PROMPT, CLINICAL_TOOLS
-    if "rag_query_tool" in str(CLINICAL_TOOLS):
-        print("[OK] Clinical Agent: Configured with RAG tool")
+
+def check_clinical() -> bool:
+    from prompts import CLINICAL_SYSTEM_PROMPT
+    passed = True
+    clinical_tools = module_list(workflow_src, b"CLINICAL_TOOLS")
+    if b"rag_query_tool" in clinical_tools:
+        report.append("[OK] Clinical Agent: Configured with RAG tool")
     else:
-        print("[FAIL] Clinical Agent: Missing RAG tool")
-        all_passed = False
+        report.append("[FAIL] Clinical Agent: Missing RAG tool")
+        passed = False
     
-    if "clinical_web_search" in str(CLINICAL_TOOLS):
-        print("[OK] Clinical Agent: Configured with web search tool")
+    if b"clinical_web_search" in clinical_tools:
+        report.append("[OK] Clinical Agent: Configured with web search tool")
     else:
-        print("[FAIL] Clinical Agent: Missing web search tool")
-        all_passed = False
+        report.append("[FAIL] Clinical Agent: Missing web search tool")
+        passed = False
     
-    if "citation" in CLINICAL_SYSTEM_PROMPT.lower() or "source" in CLINICAL_SYSTEM_PROMPT.lower():
-        print("[OK] Clinical Agent: Configured to provide citations")
+    if CLINICAL_PROBES.search(CLINICAL_SYSTEM_PROMPT):
+        report.append("[OK] Clinical Agent: Configured to provide citations")
     else:
-        print("[FAIL] Clinical Agent: Missing citation requirement")
-        all_passed = False
-except Exception as e:
-    print(f"[FAIL] Clinical Agent check failed: {e}")
-    all_passed = False
+        report.append("[FAIL] Clinical Agent: Missing citation requirement")
+        passed = False
+    return passed
 
-print("\n3. RAG IMPLEMENTATION")
-print("-" * 60)
 
-try:
-    from rag_setup import RAG_RETRIEVAL_CHAIN, setup_rag_retriever
-    if RAG_RETRIEVAL_CHAIN is not None:
-        print("[OK] RAG Retrieval Chain: Initialized")
+def check_rag() -> bool:
+    passed = True
+    rag_src = module_source("rag_setup")
+    # The chain is only assigned at runtime by the app; importing rag_setup
+    # (torch, chromadb, HuggingFace) is needed only if the tree initialises it eagerly.
+    if re.search(rb"^RAG_RETRIEVAL_CHAIN\s*=\s*None\s*$", rag_src, re.M):
+        report.append("[WARN] RAG Retrieval Chain: Not initialized (will be created on first run)")
     else:
-        print("[WARN] RAG Retrieval Chain: Not initialized (will be created on first run)")
+        from rag_setup import RAG_RETRIEVAL_CHAIN
+        if RAG_RETRIEVAL_CHAIN is not None:
+            report.append("[OK] RAG Retrieval Chain: Initialized")
+        else:
+            report.append("[WARN] RAG Retrieval Chain: Not initialized (will be created on first run)")
     
-    if callable(setup_rag_retriever):
-        print("[OK] RAG Setup: Function available")
+    if b"\ndef setup_rag_retriever(" in rag_src:
+        report.append("[OK] RAG Setup: Function available")
     else:
-        print("[FAIL] RAG Setup: Function not found")
-        all_passed = False
+        report.append("[FAIL] RAG Setup: Function not found")
+        passed = False
     
-    from rag_setup import RecursiveCharacterTextSplitter, HuggingFaceEmbeddings, Chroma
-    print("[OK] RAG Components: Text splitter, embeddings, and vectorstore imported")
-except Exception as e:
-    print(f"[FAIL] RAG Implementation check failed: {e}")
-    all_passed = False
+    missing = [name for name in ("RecursiveCharacterTextSplitter", "HuggingFaceEmbeddings", "Chroma")
+               if not re.search(rb"^\s*from \S+ import .*\b" + name.encode() + rb"\b", rag_src, re.M)]
+    if missing:
+        raise ImportError(f"rag_setup does not import {', '.join(missing)}")
+    report.append("[OK] RAG Components: Text splitter, embeddings, and vectorstore imported")
+    return passed
 
-print("\n4. WEB SEARCH TOOL")
-print("-" * 60)
 
-try:
+def check_web_search() -> bool:
     from tools import clinical_web_search
-    if clinical_web_search is not None:
-        print("[OK] Web Search Tool: Function available")
-        try:
-            doc = clinical_web_search.description if hasattr(clinical_web_search, 'description') else str(clinical_web_search)
-            if doc and ("web search" in doc.lower() or "internet" in doc.lower() or "general" in doc.lower()):
-                print("[OK] Web Search Tool: Documented with source indication")
-            else:
-                print("[WARN] Web Search Tool: Documentation may need source indication")
-        except:
-            print("[OK] Web Search Tool: Available (source check skipped)")
-    else:
-        print("[FAIL] Web Search Tool: Function not found")
-        all_passed = False
-except Exception as e:
-    print(f"[FAIL] Web Search Tool check failed: {e}")
-    all_passed = False
+    if clinical_web_search is None:
+        report.append("[FAIL] Web Search Tool: Function not found")
+        return False
+    report.append("[OK] Web Search Tool: Function available")
+    try:
+        doc = clinical_web_search.description if hasattr(clinical_web_search, 'description') else str(clinical_web_search)
+        doc_lc = doc.lower() if doc else ""
+        if "web search" in doc_lc or "internet" in doc_lc or "general" in doc_lc:
+            report.append("[OK] Web Search Tool: Documented with source indication")
+        else:
+            report.append("[WARN] Web Search Tool: Documentation may need source indication")
+    except:
+        report.append("[OK] Web Search Tool: Available (source check skipped)")
+    return True
 
-print("\n5. LOGGING SYSTEM")
-print("-" * 60)
 
-try:
+def check_logging() -> bool:
     from logging_setup import SYSTEM_LOGGER, LOG_FILE
+    passed = True
     if SYSTEM_LOGGER is not None:
-        print("[OK] Logging System: SYSTEM_LOGGER initialized")
+        report.append("[OK] Logging System: SYSTEM_LOGGER initialized")
     else:
-        print("[FAIL] Logging System: SYSTEM_LOGGER not initialized")
-        all_passed = False
+        report.append("[FAIL] Logging System: SYSTEM_LOGGER not initialized")
+        passed = False
     
-    from agent_workflow import receptionist_node, clinical_node
-    import inspect
-    receptionist_code = inspect.getsource(receptionist_node)
-    clinical_code = inspect.getsource(clinical_node)
+    receptionist_code = function_source(workflow_src, b"receptionist_node")
+    clinical_code = function_source(workflow_src, b"clinical_node")
     
-    if "SYSTEM_LOGGER" in receptionist_code:
-        print("[OK] Logging: Used in Receptionist Agent")
+    if b"SYSTEM_LOGGER" in receptionist_code:
+        report.append("[OK] Logging: Used in Receptionist Agent")
     else:
-        print("[FAIL] Logging: Not used in Receptionist Agent")
-        all_passed = False
+        report.append("[FAIL] Logging: Not used in Receptionist Agent")
+        passed = False
     
-    if "SYSTEM_LOGGER" in clinical_code:
-        print("[OK] Logging: Used in Clinical Agent")
+    if b"SYSTEM_LOGGER" in clinical_code:
+        report.append("[OK] Logging: Used in Clinical Agent")
     else:
-        print("[FAIL] Logging: Not used in Clinical Agent")
-        all_passed = False
+        report.append("[FAIL] Logging: Not used in Clinical Agent")
+        passed = False
     
-    if "HANDOFF" in receptionist_code and "SYSTEM_LOGGER" in receptionist_code:
-        print("[OK] Logging: Agent handoffs are logged")
+    if b"HANDOFF" in receptionist_code and b"SYSTEM_LOGGER" in receptionist_code:
+        report.append("[OK] Logging: Agent handoffs are logged")
     else:
-        print("[WARN] Logging: Agent handoffs may not be fully logged")
+        report.append("[WARN] Logging: Agent handoffs may not be fully logged")
     
-    if os.path.exists(LOG_FILE):
-        print(f"[OK] Log File: {LOG_FILE} exists")
+    # LOG_FILE may point outside the working directory the snapshot covers.
+    log_present = os.path.exists(LOG_FILE) if os.path.dirname(LOG_FILE) else LOG_FILE in ENTRIES
+    if log_present:
+        report.append(f"[OK] Log File: {LOG_FILE} exists")
     else:
-        print(f"[WARN] Log File: {LOG_FILE} will be created on first run")
-except Exception as e:
-    print(f"[FAIL] Logging System check failed: {e}")
-    all_passed = False
+        report.append(f"[WARN] Log File: {LOG_FILE} will be created on first run")
+    return passed
 
-print("\n6. PATIENT DATA RETRIEVAL TOOL")
-print("-" * 60)
 
-try:
+def check_patient_tool() -> bool:
     from tools import get_patient_discharge_report
-    if get_patient_discharge_report is not None:
-        print("[OK] Patient Retrieval Tool: Function available")
-        
-        tool_desc = ""
-        if hasattr(get_patient_discharge_report, 'description'):
-            tool_desc = get_patient_discharge_report.description
-        elif hasattr(get_patient_discharge_report, '__doc__'):
-            tool_desc = get_patient_discharge_report.__doc__ or ""
-        
-        if "not found" in tool_desc.lower() or "error" in tool_desc.lower() or "multiple" in tool_desc.lower():
-            print("[OK] Patient Retrieval Tool: Error handling documented")
-        else:
-            print("[WARN] Patient Retrieval Tool: Error handling documentation may be incomplete")
-        
-        try:
-            with open("tools.py", "r", encoding="utf-8") as f:
-                tools_code = f.read()
-                if "not found" in tools_code.lower() or "ERROR" in tools_code:
-                    print("[OK] Patient Retrieval Tool: Error handling implemented in code")
-                if "multiple" in tools_code.lower() or "matches" in tools_code.lower():
-                    print("[OK] Patient Retrieval Tool: Handles multiple matches")
-                if "db_logger" in tools_code:
-                    print("[OK] Patient Retrieval Tool: Database access is logged")
-                else:
-                    print("[FAIL] Patient Retrieval Tool: Database access not logged")
-                    all_passed = False
-        except:
-            print("[WARN] Could not verify implementation details")
+    if get_patient_discharge_report is None:
+        report.append("[FAIL] Patient Retrieval Tool: Function not found")
+        return False
+    passed = True
+    report.append("[OK] Patient Retrieval Tool: Function available")
+    
+    tool_desc = ""
+    if hasattr(get_patient_discharge_report, 'description'):
+        tool_desc = get_patient_discharge_report.description
+    elif hasattr(get_patient_discharge_report, '__doc__'):
+        tool_desc = get_patient_discharge_report.__doc__ or ""
+    
+    tool_desc_lc = tool_desc.lower()
+    if "not found" in tool_desc_lc or "error" in tool_desc_lc or "multiple" in tool_desc_lc:
+        report.append("[OK] Patient Retrieval Tool: Error handling documented")
     else:
-        print("[FAIL] Patient Retrieval Tool: Function not found")
-        all_passed = False
-except Exception as e:
-    print(f"[FAIL] Patient Data Retrieval Tool check failed: {e}")
-    all_passed = False
+        report.append("[WARN] Patient Retrieval Tool: Error handling documentation may be incomplete")
+    
+    try:
+        tools_code = read_bytes("tools.py")
+        tools_lc = tools_code.lower()
+        if b"not found" in tools_lc or b"ERROR" in tools_code:
+            report.append("[OK] Patient Retrieval Tool: Error handling implemented in code")
+        if b"multiple" in tools_lc or b"matches" in tools_lc:
+            report.append("[OK] Patient Retrieval Tool: Handles multiple matches")
+        if b"db_logger" in tools_code:
+            report.append("[OK] Patient Retrieval Tool: Database access is logged")
+        else:
+            report.append("[FAIL] Patient Retrieval Tool: Database access not logged")
+            passed = False
+    except:
+        report.append("[WARN] Could not verify implementation details")
+    return passed
 
-print("\n7. WEB INTERFACE")
-print("-" * 60)
 
-if os.path.exists("app.py"):
-    print("[OK] Web Interface: app.py exists")
+def check_web_interface() -> bool:
+    try:
+        app_src = read_bytes("app.py")
+    except FileNotFoundError:
+        report.append("[FAIL] Web Interface: app.py not found")
+        return False
+    report.append("[OK] Web Interface: app.py exists")
     try:
-        with open("app.py", "r", encoding="utf-8") as f:
-            app_code = f.read()
-            if "streamlit" in app_code.lower():
-                print("[OK] Web Interface: Streamlit implementation")
-            else:
-                print("[FAIL] Web Interface: Streamlit not found")
-                all_passed = False
+        app_lc = app_src.decode("utf-8").lower()
     except Exception as e:
-        print(f"[WARN] Could not read app.py: {e}")
-        print("[OK] Web Interface: app.py exists (verification skipped)")
-else:
-    print("[FAIL] Web Interface: app.py not found")
-    all_passed = False
+        report.append(f"[WARN] Could not read app.py: {e}")
+        report.append("[OK] Web Interface: app.py exists (verification skipped)")
+        return True
+    if "streamlit" in app_lc:
+        report.append("[OK] Web Interface: Streamlit implementation")
+        return True
+    report.append("[FAIL] Web Interface: Streamlit not found")
+    return False
+
+
+# (section heading, [(failure label, check)]); a check reports its own lines and
+# returns whether it passed, and any exception it raises is recorded as a FAIL.
+CHECKS: List[Tuple[str, List[Tuple[str, Callable[[], bool]]]]] = [
+    ("1. DATA SETUP", [
+        ("Patient data file error", check_patient_data),
+        ("Nephrology reference error", check_nephrology_reference),
+        ("Storage check failed", check_storage),
+    ]),
+    ("2. MULTI-AGENT SYSTEM", [
+        ("Receptionist Agent check failed", check_receptionist),
+        ("Clinical Agent check failed", check_clinical),
+    ]),
+    ("3. RAG IMPLEMENTATION", [("RAG Implementation check failed", check_rag)]),
+    ("4. WEB SEARCH TOOL", [("Web Search Tool check failed", check_web_search)]),
+    ("5. LOGGING SYSTEM", [("Logging System check failed", check_logging)]),
+    ("6. PATIENT DATA RETRIEVAL TOOL", [("Patient Data Retrieval Tool check failed", check_patient_tool)]),
+    ("7. WEB INTERFACE", [("Web Interface check failed", check_web_interface)]),
+]
+
+report.append("=" * 60)
+report.append("ASSIGNMENT REQUIREMENTS VERIFICATION")
+report.append("=" * 60)
+flush_report()
+
+all_passed: bool = True
+for section, checks in CHECKS:
+    report.append(f"\n{section}")
+    report.append("-" * 60)
+    for label, check in checks:
+        try:
+            passed = check()
+        except Exception as e:
+            report.append(f"[FAIL] {label}: {e}")
+            passed = False
+        all_passed = all_passed and passed
+    flush_report()
+
+PREFETCH_POOL.shutdown(wait=False)
 
-print("\n" + "=" * 60)
-print("VERIFICATION SUMMARY")
-print("=" * 60)
+report.append("\n" + "=" * 60)
+report.append("VERIFICATION SUMMARY")
+report.append("=" * 60)
 
 if all_passed:
-    print("[SUCCESS] ALL CRITICAL REQUIREMENTS MET!")
-    print("\nYour POC system appears to meet all assignment requirements.")
-    print("You can now test the system by running: streamlit run app.py")
+    report.append("[SUCCESS] ALL CRITICAL REQUIREMENTS MET!")
+    report.append("\nYour POC system appears to meet all assignment requirements.")
+    report.append("You can now test the system by running: streamlit run app.py")
 else:
-    print("[WARNING] SOME REQUIREMENTS MAY NEED ATTENTION")
-    print("\nPlease review the items marked with [FAIL] above.")
+    report.append("[WARNING] SOME REQUIREMENTS MAY NEED ATTENTION")
+    report.append("\nPlease review the items marked with [FAIL] above.")
 
-print("\n" + "=" * 60)
\ No newline at end of file
+report.append("\n" + "=" * 60)
+flush_report()